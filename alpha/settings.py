@@ -107,6 +107,9 @@ JINJA2_TEMPLATE_DIRS = (
     os.path.join(SITE_ROOT, 'templates-jinja2'),
 )
 
+# Compiled templates, shared by the workers. Fill it at deploy time with ./manage.py compile_templates
+JINJA2_BYTECODE_CACHE_DIR = os.path.join(os.path.dirname(SITE_ROOT), '.jinja2-bytecode')
+
 TEMPLATE_CONTEXT_PROCESSORS = (
     'django.contrib.auth.context_processors.auth',
     'django.core.context_processors.i18n',
@@ -34,6 +34,7 @@ urlpatterns = patterns(
     url(r'^global/$', 'pau.views.alpha.global_stream', name='global'),
 
     url(r'^omo-api-proxy/posts$', 'pau.views.alpha.create_post'),
+    url(r'^omo-api-proxy/batch$', 'pau.views.proxy.ajax_api_proxy_batch', name='omo_api_proxy_batch'),
     url(r'^omo-api-proxy/(?P<path>.+)?$', 'pau.views.proxy.ajax_api_proxy', name='omo_api_proxy'),
     url(r'^mentions/$', 'pau.views.alpha.mentions', name='mentions'),
     url(r'^interactions/$', 'pau.views.alpha.interactions', name='interactions'),
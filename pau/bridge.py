@@ -1,16 +1,31 @@
 import collections
+import datetime
+import hashlib
+import itertools
 import logging
+import re
+import sys
+import threading
+import time
 import simplejson as json
+from functools import partial
+from multiprocessing.pool import ThreadPool
 from iso8601 import parse_date
 
-import adnpy
-
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.db import close_old_connections
 from django.http import Http404
 
-from paucore.stats.statsd_client import timer
-from paucore.utils.data import extract_id, is_seq_not_string
-from paucore.utils.web import append_query_string, smart_reverse
+from paucore.stats.statsd_client import graphite_count, timer
+from paucore.utils.data import CacheLockFailed, cache_lock, extract_id
+from paucore.utils.htmlgen import clean_text
+from paucore.utils.python import LocalLRUCache, SingleFlight, lru_cache
+from paucore.utils.web import MultipartFormStream, append_query_string, smart_reverse
+
+from pau.middleware import LazyApi
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +50,12 @@ def get_annotation_by_key(annotations_by_key, key, result_format='list'):
 
 
 class BridgeJSON(dict):
+    """
+    Attribute access over parsed api json. Only the top level is copied when it's built, nested mappings (and lists of
+    mappings) are left as they came back from the api and only get wrapped the first time somebody reads them. The
+    wrapper replaces the raw value, so changes made through it stick and it's still a plain dict to json.dumps.
+    """
+
     def __setattr__(self, name, val):
         return self.__setitem__(name, val)
 
@@ -45,81 +66,410 @@ class BridgeJSON(dict):
             raise AttributeError(name)
 
     def __init__(self, data=None):
-        super(BridgeJSON, self).__init__()
-        if not data:
-            return
+        if data:
+            super(BridgeJSON, self).__init__(data)
+        else:
+            super(BridgeJSON, self).__init__()
 
-        for k, v in data.iteritems():
-            if isinstance(v, collections.Mapping):
-                self[k] = BridgeJSON(v)
-            elif v and is_seq_not_string(v) and isinstance(v[0], collections.Mapping):
-                self[k] = [BridgeJSON(i) for i in v]
-            else:
-                self[k] = v
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        wrapped = wrap_json(value)
+        if wrapped is not value:
+            dict.__setitem__(self, key, wrapped)
+
+        return wrapped
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+
+        return default
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+
+        return self[key]
+
+    def itervalues(self):
+        return (self[k] for k in self)
+
+    def iteritems(self):
+        return ((k, self[k]) for k in self)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def get_raw(self, key, default=None):
+        "Like get, but hands back the value as parsed without wrapping it"
+        return dict.get(self, key, default)
 
     @classmethod
     def from_string(cls, raw_json):
         return cls(json.loads(raw_json))
 
 
+def wrap_json(value):
+    "Wrap a parsed json mapping, or list of mappings, in BridgeJSON. Anything else comes back untouched."
+    if isinstance(value, BridgeJSON):
+        return value
+    elif isinstance(value, collections.Mapping):
+        return BridgeJSON(value)
+    elif value and isinstance(value, list) and isinstance(value[0], collections.Mapping) and not isinstance(value[0], BridgeJSON):
+        return [BridgeJSON(i) for i in value]
+
+    return value
+
+
+def clean_entity_text(value):
+    """
+    clean_text for text that has entities. Their positions count characters of the text as the api sent it, so text
+    that would lose characters is left alone for HtmlGen to clean up a piece at a time.
+    """
+    cleaned = clean_text(value)
+    if isinstance(value, basestring) and len(cleaned) != len(value):
+        return value
+
+    return cleaned
+
+
+@lru_cache(maxsize=10240)
+def parse_api_date(value):
+    """
+    Parse an api timestamp into a naive UTC datetime. The api only ever sends YYYY-MM-DDTHH:MM:SSZ so we slice that
+    shape apart directly and only hand anything else to iso8601. A page repeats a lot of timestamps (thread replies,
+    the same user on many posts) so results are memoized, datetimes are immutable so sharing them is fine.
+    """
+    if len(value) == 20 and value[19] == 'Z' and value[10] == 'T' and value[4] == value[7] == '-' and value[13] == value[16] == ':':
+        year, month, day, hour, minute, second = fields = (value[0:4], value[5:7], value[8:10], value[11:13],
+                                                           value[14:16], value[17:19])
+        # int() would also take signs, spaces and non ascii digits, which iso8601 turns away
+        if not ''.join(fields).strip('0123456789'):
+            try:
+                return datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second))
+            except ValueError:
+                pass
+
+    # XXX: We need to change our code at some point to handle datetimes with a timezone
+    return parse_date(value).replace(tzinfo=None)
+
+
+@lru_cache(maxsize=10240)
+def image_url_variant(url, width=None, height=None):
+    "The resized url for an api image. The same few avatars show up all over a page so hold on to the urlencoded result."
+    params = {}
+    if width:
+        params['w'] = width
+    if height:
+        params['h'] = height
+
+    return append_query_string(url, params=params)
+
+
+class APIImage(BridgeJSON):
+    """
+    An api image object (avatar_image, cover_image). Besides the api's own keys it answers for sized variants, '80s' is
+    80x80 and '862r' is 862 wide, built from url when they're asked for.
+    """
+    variant_re = re.compile(r'^(\d+)([sr])$')
+
+    def __missing__(self, key):
+        match = self.variant_re.match(key) if isinstance(key, basestring) else None
+        if not match:
+            raise KeyError(key)
+
+        size, kind = int(match.group(1)), match.group(2)
+
+        return self.get_url(width=size, height=size if kind == 's' else None)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def get_url(self, width=None, height=None):
+        return image_url_variant(self.url, width=width, height=height)
+
+
 class APIModel(BridgeJSON):
     @classmethod
-    def from_response_data(cls, data):
+    def from_response_data(cls, data, users=None):
+        model = cls(data)
+        model.annotations_by_key = annotations_to_dict(model.get('annotations'))
+
+        return model
+
+    def get_annotation(self, key, result_format='list'):
+        return get_annotation_by_key(self.get('annotations_by_key', {}), key, result_format=result_format)
+
+
+class APIRecord(object):
+    """
+    A slotted stand in for APIModel, for the objects we hold hundreds of per page. The fields in _fields get a slot each,
+    everything else the api sends along goes in a BridgeJSON kept on the side. It reads like the dict based models:
+    .attr, [key], get(), in and keys() all work and cover both.
+    """
+    __slots__ = ('_extra', 'annotations', 'annotations_by_key')
+    _fields = ('annotations', 'annotations_by_key')
+    _field_set = frozenset(_fields)
+
+    def __init__(self, data=None):
+        object.__setattr__(self, '_extra', BridgeJSON())
+        if not data:
+            return
+
+        if isinstance(data, APIRecord):
+            data = data.to_dict()
+
+        field_set = self._field_set
+        for k, v in dict.iteritems(data):
+            if k in field_set:
+                object.__setattr__(self, k, wrap_json(v))
+            else:
+                dict.__setitem__(self._extra, k, v)
+
+    @classmethod
+    def from_response_data(cls, data, users=None):
         model = cls(data)
         model.annotations_by_key = annotations_to_dict(model.get('annotations'))
 
         return model
 
+    def __getattr__(self, name):
+        # only called when there's no slot value, so this is the rare field path
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        try:
+            return self._extra[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, val):
+        if name in self._field_set:
+            object.__setattr__(self, name, val)
+        else:
+            self._extra[name] = val
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            try:
+                return object.__getattribute__(self, key)
+            except AttributeError:
+                raise KeyError(key)
+
+        return self._extra[key]
+
+    __setitem__ = __setattr__
+
+    def __delitem__(self, key):
+        if key in self._field_set:
+            try:
+                object.__delattr__(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key):
+        if key in self._field_set:
+            return hasattr(self, key)
+
+        return key in self._extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [f for f in self._fields if hasattr(self, f)] + self._extra.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def iteritems(self):
+        return ((k, self[k]) for k in self.keys())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def to_dict(self):
+        return dict(self.iteritems())
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.to_dict())
+
     def get_annotation(self, key, result_format='list'):
         return get_annotation_by_key(self.get('annotations_by_key', {}), key, result_format=result_format)
 
 
-class APIUser(APIModel):
+class APIUser(APIRecord):
+    # The fields the presenters and templates actually read
+    __slots__ = ('id', 'username', 'name', 'avatar_image', 'cover_image', 'description', 'counts', 'created_at', 'timezone',
+                 'you_follow', 'you_muted', 'verified_domain', 'verified_link')
+    _fields = APIRecord._fields + __slots__
+    _field_set = frozenset(_fields)
+
     @classmethod
-    def from_response_data(cls, data):
+    def from_response_data(cls, data, users=None):
+        if users is not None:
+            return users.get_or_build(data)
+
         user = super(APIUser, cls).from_response_data(data)
-        user.avatar_image['30s'] = append_query_string(user.avatar_image.url, params={'w': 30, 'h': 30})
-        user.avatar_image['57s'] = append_query_string(user.avatar_image.url, params={'w': 57, 'h': 57})
-        user.avatar_image['80s'] = append_query_string(user.avatar_image.url, params={'w': 80, 'h': 80})
-        user.cover_image['720r'] = append_query_string(user.cover_image.url, params={'w': 720})
-        user.cover_image['862r'] = append_query_string(user.cover_image.url, params={'w': 862})
+        # sized variants ('30s', '862r', ...) are worked out when something asks for them
+        user.avatar_image = APIImage(user.avatar_image)
+        user.cover_image = APIImage(user.cover_image)
         user.id = int(user.id)
-        # XXX: We need to change our code at some point to handle datetimes with a timezone
-        user.created_at = parse_date(user.created_at).replace(tzinfo=None)
+        user.created_at = parse_api_date(user.created_at)
         if 'name' not in user:
             user.name = ''
+        # sanitize what people type in once here instead of in every element it ends up in
+        if 'username' in user:
+            user.username = clean_text(user.username)
+        user.name = clean_text(user.name)
+        if user.description and 'text' in user.description:
+            user.description['text'] = clean_entity_text(user.description['text'])
 
         return user
 
 
-class APIPost(APIModel):
+class APIPost(APIRecord):
+    # The fields the presenters and templates actually read
+    __slots__ = ('id', 'user', 'text', 'entities', 'created_at', 'source', 'reply_to', 'thread_id', 'repost_of', 'is_deleted',
+                 'machine_only', 'num_replies', 'num_stars', 'num_reposts', 'you_starred', 'you_reposted', 'starred_by',
+                 'reposters')
+    _fields = APIRecord._fields + __slots__
+    _field_set = frozenset(_fields)
+
     @classmethod
-    def from_response_data(cls, data):
+    def from_response_data(cls, data, users=None):
         post = super(APIPost, cls).from_response_data(data)
         post.id = int(post.id)
         if 'user' in post:
-            post.user = APIUser.from_response_data(post.user)
+            post.user = APIUser.from_response_data(post.user, users=users)
         else:
             post.user = None
-        post.starred_by = [APIUser.from_response_data(u) for u in post.get('starred_by', [])]
-        post.reposters = [APIUser.from_response_data(u) for u in post.get('reposters', [])]
-        # XXX: We need to change our code at some point to handle datetimes with a timezone
-        post.created_at = parse_date(post.created_at).replace(tzinfo=None)
+        post.starred_by = [APIUser.from_response_data(u, users=users) for u in post.get('starred_by', [])]
+        post.reposters = [APIUser.from_response_data(u, users=users) for u in post.get('reposters', [])]
+        post.created_at = parse_api_date(post.created_at)
+        if 'text' in post:
+            post.text = clean_entity_text(post.text)
 
         # If there is a repost object setup the avatar assets for it as well
         repost_of = post.get('repost_of')
         if repost_of:
-            post.repost_of = APIPost.from_response_data(post.repost_of)
+            post.repost_of = APIPost.from_response_data(repost_of, users=users)
 
         return post
 
 
+class UserIdentityMap(object):
+    """
+    The users we've already built for one alpha request, by id. A stream page names the same handful of people over and
+    over (authors, starred_by, reposters, repost_of.user) so we only build each APIUser once and hand out that instance.
+    Only ever used for reads, a write can come back with a user that is newer than the one we have.
+    """
+
+    def __init__(self):
+        self.users = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_or_build(self, data):
+        user_id = int(data['id'])
+        user = self.users.get(user_id)
+        if user is not None:
+            with self.lock:
+                self.hits += 1
+            return user
+
+        with self.lock:
+            self.misses += 1
+        user = APIUser.from_response_data(data)
+        # if a concurrent call got here first, keep theirs so everybody shares one instance
+        return self.users.setdefault(user_id, user)
+
+    def flush_stats(self):
+        with self.lock:
+            hits, misses = self.hits, self.misses
+            self.hits = self.misses = 0
+
+        if hits:
+            graphite_count('omo.bridge.user_map.hit', hits)
+        if misses:
+            graphite_count('omo.bridge.user_map.miss', misses)
+
+
+_user_map_lock = threading.Lock()
+
+
+def get_user_identity_map(request):
+    users = getattr(request, '_api_user_map', None)
+    if users is None:
+        # fan_out can have a few api calls decoding for the same request at once
+        with _user_map_lock:
+            users = getattr(request, '_api_user_map', None)
+            if users is None:
+                users = request._api_user_map = UserIdentityMap()
+
+    return users
+
+
+class AppTokenRequest(object):
+    """
+    Stands in for a request when fetching something that's the same for everybody, so that nothing about whichever
+    visitor happened to trigger the fetch ends up in a shared cache entry: it has no query string, no viewer, and makes
+    its api calls with the app token.
+    """
+
+    GET = {}
+
+    def __init__(self, secure=False):
+        self.secure = secure
+        self.user = AnonymousUser()
+        self.session = {}
+        self.META = {}
+        self.omo_api = LazyApi.get_adn_api(access_token=settings.APP_TOKEN, token_class='app', headers={
+            'X-ADN-Migration-Overrides': LazyApi().enabled_migrations,
+        })
+
+    def is_secure(self):
+        return self.secure
+
+
 class APIChannel(APIModel):
     @classmethod
-    def from_response_data(cls, data):
+    def from_response_data(cls, data, users=None):
         channel = super(APIChannel, cls).from_response_data(data)
         if 'owner' in channel:
-            channel.owner = APIUser.from_response_data(channel.owner)
+            channel.owner = APIUser.from_response_data(channel.get_raw('owner'), users=users)
         else:
             channel.owner = None
 
@@ -143,15 +493,14 @@ class APIInteraction(APIModel):
     allowed_interactions = action_mapping.keys() + ['welcome']
 
     @classmethod
-    def from_response_data(cls, data):
+    def from_response_data(cls, data, users=None):
         interaction = super(APIInteraction, cls).from_response_data(data)
 
         api_model = cls.action_mapping.get(interaction.action)
         if api_model:
-            interaction.objects = map(api_model.from_response_data, interaction.objects)
-        interaction.users = map(APIUser.from_response_data, interaction.users)
-        # XXX: We need to change our code at some point to handle datetimes with a timezone
-        interaction.event_date = parse_date(interaction.event_date).replace(tzinfo=None)
+            interaction.objects = [api_model.from_response_data(o, users=users) for o in interaction.get_raw('objects')]
+        interaction.users = [APIUser.from_response_data(u, users=users) for u in interaction.get_raw('users')]
+        interaction.event_date = parse_api_date(interaction.event_date)
         return interaction
 
 
@@ -184,15 +533,86 @@ class AlphaInsufficientStorageException(AlphaAPIException):
     pass
 
 
+def raise_for_api_response(response):
+    code = response.meta.code
+
+    if code == 200:
+        return
+    elif code == 400:
+        raise AlphaBadRequestAPIException(response)
+    elif code == 401:
+        raise AlphaAuthAPIException(response)
+    elif code == 403:
+        raise PermissionDenied()
+    elif code == 404:
+        raise Http404()
+    elif code == 429:
+        raise AlphaRateLimitAPIException(response)
+    elif code == 507:
+        raise AlphaInsufficientStorageException(response)
+    else:
+        # anything else not 200
+        raise AlphaAPIException(response)
+
+
+@timer('omo.bridge.decode_api_response')
+def decode_api_response(content, model=None, users=None):
+    """
+    Parse an api response body and build the envelope in one go. If a model is given, data (or each item of data) is
+    turned into that model directly from the parsed json, so the only other pass over the tree is the one
+    from_response_data makes over the keys it cares about. Pass a UserIdentityMap as users to share APIUser instances.
+    """
+    response = BridgeJSON(json.loads(content))
+    raise_for_api_response(response)
+
+    if model:
+        data = response.get_raw('data')
+        if isinstance(data, list):
+            response.data = [model.from_response_data(d, users=users) for d in data]
+        elif data is not None:
+            response.data = model.from_response_data(data, users=users)
+
+        if users is not None:
+            users.flush_stats()
+
+    return response
+
+
+def stream_etag_parts(meta):
+    """
+    What a stream response's meta says about where the stream is, for building an ETag. New posts move max_id, paging
+    moves min_id and reading moves the marker. None when the response isn't a stream.
+    """
+    if not meta:
+        return None
+
+    marker = meta.get('marker') or {}
+    parts = (meta.get('max_id'), meta.get('min_id'), marker.get('id'), marker.get('last_read_id'), marker.get('version'))
+    if not any(parts):
+        return None
+
+    return parts + (meta.get('more'),)
+
+
+def post_etag_parts(post):
+    return (post.get('id'), post.get('is_deleted'), post.get('num_replies'), post.get('num_stars'), post.get('num_reposts'),
+            post.get('you_starred'), post.get('you_reposted'))
+
+
 def api_extract_id(obj):
     "Allows a method to take either a id, an APIModel, or a real model"
 
-    if isinstance(obj, APIModel):
+    if isinstance(obj, (APIModel, APIRecord)):
         return obj.get('id')
     else:
         return extract_id(obj)
 
 
+# Identical GETs made on the app token at the same time are joined onto one upstream call, see AlphaAPI.call_api
+COALESCE_APP_TOKEN_GETS = getattr(settings, 'ALPHA_API_COALESCE_APP_TOKEN_GETS', True)
+_in_flight_calls = SingleFlight()
+
+
 class AlphaAPI(object):
     # keep this in sync with the LazyApi middleware
     migrations = set()
@@ -202,60 +622,68 @@ class AlphaAPI(object):
         self.enabled_migrations = '&'.join('%s=1' % m for m in self.migrations)
         self.access_token = None
 
-    def call_api(self, request, path, params=None, data=None, method='GET', post_type='json', headers=None, files=None):
+    def call_api(self, request, path, params=None, data=None, method='GET', post_type='json', headers=None, files=None,
+                 model=None, stream=False, raw_content=False, request_params=True):
+        """
+        Make an api call and decode the response. With stream=True the undecoded requests response comes back instead,
+        with its body still unread, and the caller has to close() it. With raw_content=True it's the body as a string.
+        The request's query string is passed on to the api unless request_params is False.
+        """
         headers = headers or {}
         api_params = {
             'include_annotations': '1',
             'include_delete': '0'
         }
 
-        api_params.update(request.GET)
+        if request_params:
+            api_params.update(request.GET)
         if params:
             api_params.update(params)
 
         api_method = request.omo_api.request
-        if data and method in ('POST', 'PUT'):
+        if files:
+            # requests would build the whole multipart body in memory, this reads the uploads out as it sends them
+            data = MultipartFormStream(data, files)
+            headers = dict(headers, **{'Content-Type': data.content_type})
+            files = None
+        elif data and method in ('POST', 'PUT'):
             if post_type == 'json':
                 # adnpy will json.dumps in this case
                 api_method = request.omo_api.request_json
 
-        # TODO remove all the alpha specific exceptions and just use the adnpy ones
-        try:
-            response = api_method(method, path, params=api_params, data=data, headers=headers, files=files)
-        except adnpy.errors.AdnBadRequestAPIException, e:
-            # 400
-            raise AlphaBadRequestAPIException(e.response)
-        except adnpy.errors.AdnAuthAPIException, e:
-            # 401
-            raise AlphaAuthAPIException(e.response)
-        except adnpy.errors.AdnPermissionDenied:
-            # 403
-            raise PermissionDenied()
-        except adnpy.errors.AdnMissing:
-            # 404
-            raise Http404()
-        except adnpy.errors.AdnRateLimitAPIException, e:
-            # 429
-            raise AlphaRateLimitAPIException(e.response)
-        except adnpy.errors.AdnInsufficientStorageException, e:
-            # 507
-            raise AlphaInsufficientStorageException(e.response)
-        except adnpy.errors.AdnAPIException, e:
-            # anything else not 200
-            raise AlphaAPIException(e.response)
-
-        # return the exact same format as old_call_api
-        return BridgeJSON(response.serialize())
+        users = get_user_identity_map(request) if model and method == 'GET' else None
+
+        if method == 'GET' and not stream and COALESCE_APP_TOKEN_GETS and request.omo_api.token_class == 'app':
+            # Everybody on the app token gets the same answer, so identical calls in flight at the same time share one
+            # upstream request. Only the body is shared, each caller still decodes its own copy of the objects.
+            key = repr((path, sorted(api_params.iteritems()), sorted(headers.iteritems()), request.omo_api.token_class))
+            content, shared = _in_flight_calls.do(key, self._fetch_content, api_method, method, path, api_params, headers)
+            if shared:
+                graphite_count('omo.bridge.call_api.coalesced')
+        else:
+            # Ask adnpy for the raw http response. Letting it parse the body builds its own model tree, which we'd then
+            # have to serialize back to dicts and walk again, instead we decode the body once here.
+            raw_response = api_method(method, path, params=api_params, data=data, headers=headers, files=files,
+                                      raw_response=True, stream=stream)
+
+            if stream:
+                return raw_response
+
+            content = raw_response.content
+
+        if raw_content:
+            return content
+
+        return decode_api_response(content, model=model, users=users)
+
+    def _fetch_content(self, api_method, method, path, api_params, headers):
+        return api_method(method, path, params=api_params, headers=headers, raw_response=True).content
 
     def get_posts(self, request, path, *args, **kwargs):
-        response = self.call_api(request, path, *args, **kwargs)
-        response.data = [APIPost.from_response_data(post) for post in response.data]
-        return response
+        return self.call_api(request, path, model=APIPost, *args, **kwargs)
 
     def get_users(self, request, path, *args, **kwargs):
-        response = self.call_api(request, path, *args, **kwargs)
-        response.data = [APIUser.from_response_data(post) for post in response.data]
-        return response
+        return self.call_api(request, path, model=APIUser, *args, **kwargs)
 
     def posts_stream_global(self, request, *args, **kwargs):
         return self.get_posts(request, '/posts/stream/global', *args, **kwargs)
@@ -285,9 +713,7 @@ class AlphaAPI(object):
 
     def get_post(self, request, post, *args, **kwargs):
         post_id = api_extract_id(post)
-        response = self.call_api(request, '/posts/%s' % post_id, *args, **kwargs)
-        response.data = APIPost.from_response_data(response.data)
-        return response
+        return self.call_api(request, '/posts/%s' % post_id, model=APIPost, *args, **kwargs)
 
     def get_thread(self, request, post, *args, **kwargs):
         post_id = api_extract_id(post)
@@ -318,21 +744,17 @@ class AlphaAPI(object):
         allowed_interactions = APIInteraction.allowed_interactions
         kwargs['params'].setdefault('interaction_actions', ','.join(allowed_interactions))
 
-        response = self.call_api(request, '/users/me/interactions', *args, **kwargs)
-        response.data = filter(None, [APIInteraction.from_response_data(interaction) for interaction in response.data])
+        response = self.call_api(request, '/users/me/interactions', model=APIInteraction, *args, **kwargs)
+        response.data = filter(None, response.data)
         return response
 
     def get_user(self, request, user, *args, **kwargs):
         user_id = api_extract_id(user)
-        response = self.call_api(request, '/users/%s' % user_id, *args, **kwargs)
-        response.data = APIUser.from_response_data(response.data)
-        return response
+        return self.call_api(request, '/users/%s' % user_id, model=APIUser, *args, **kwargs)
 
     def follow(self, request, target_user, *args, **kwargs):
         target_id = api_extract_id(target_user)
-        response = self.call_api(request, '/users/%s/follow' % target_id, method='POST', *args, **kwargs)
-        response.data = APIUser.from_response_data(response.data)
-        return response
+        return self.call_api(request, '/users/%s/follow' % target_id, method='POST', model=APIUser, *args, **kwargs)
 
     class Stream(object):
         """Inspired by tweepy.cursor.Cursor"""
@@ -365,6 +787,194 @@ class AlphaAPI(object):
 api = AlphaAPI()
 
 
+def _fetch_thread_pages(request, post_id, params, since_id=None, before_id=None, max_rounds=8):
+    """
+    Page back through a thread, optionally only the part between since_id and before_id (both exclusive). Gives up after
+    max_rounds pages. Returns the posts, the last response and whether the api said there was more.
+    """
+    params = dict(params)
+    if since_id is not None:
+        params['since_id'] = since_id
+
+    stream = api.Stream(api.get_thread, request, post_id, params=params)
+    stream.min_id = before_id
+
+    posts = []
+    response = None
+    for rounds, response in enumerate(stream, 1):
+        posts.extend(response.data)
+        if rounds >= max_rounds:
+            break
+
+    return posts, response, bool(stream.has_more)
+
+
+def _expected_thread_remainder(first_page, thread_id):
+    """
+    Once the first page of a thread says there's more, the rest of it sits between the thread's root id and that page's
+    min_id. Guess how many posts that is from how densely packed the first page was.
+    """
+    min_id = int(first_page.meta.min_id)
+    max_id = int(first_page.meta.max_id)
+    density = float(len(first_page.data)) / max(max_id - min_id + 1, 1)
+
+    return (min_id - thread_id) * density
+
+
+def _thread_windows(first_page, thread_id, count, expected):
+    """
+    Split the id range the rest of a thread sits in up so the windows can be fetched at once instead of one page after
+    another, about one window per page of expected posts.
+    """
+    min_id = int(first_page.meta.min_id)
+    num_windows = int(min(max(expected / count, 1), getattr(settings, 'CONVERSATION_PREFETCH_WINDOWS', 4)))
+
+    # (since_id, before_id) pairs, both exclusive, so start one below the root and let each window end one past where
+    # the next one starts
+    low = thread_id - 1
+    step = (min_id - low) / num_windows
+    since_ids = [low + step * i for i in range(num_windows)]
+    before_ids = [since_id + 1 for since_id in since_ids[1:]] + [min_id]
+
+    return zip(since_ids, before_ids)
+
+
+def _load_conversation(request, post_id, params, max_rounds):
+    "Fetch a whole thread. Returns all of its posts in id order, and whether it was too long to show."
+    posts, first_page, more = _fetch_thread_pages(request, post_id, params, max_rounds=1)
+    thread_id = posts[0].get('thread_id') if posts else None
+    too_long = False
+
+    if more and thread_id:
+        expected = _expected_thread_remainder(first_page, int(thread_id))
+        # The guess is only as good as the first page is typical, so leave threads near the limit to the real count
+        if len(posts) + expected > 1.25 * max_rounds * params['count']:
+            # Every window can page on its own, so a thread we'd end up calling too long anyway could cost a lot more
+            # calls than paging through it one page at a time did. Don't bother.
+            graphite_count('omo.bridge.conversation.too_long_estimate')
+            too_long = True
+        else:
+            windows = _thread_windows(first_page, int(thread_id), params['count'], expected)
+            calls = dict(
+                (window, partial(_fetch_thread_pages, request, post_id, params, since_id=window[0],
+                                 before_id=window[1], max_rounds=max_rounds - 1))
+                for window in windows
+            )
+            # these run on their own pool, get_conversation itself is usually running on the fan out pool
+            for window_posts, _, window_more in fan_out(request, calls, pool=_get_thread_pool()).itervalues():
+                posts.extend(window_posts)
+                too_long = too_long or window_more
+
+            too_long = too_long or len(posts) > max_rounds * params['count']
+
+    posts.sort(key=lambda p: p.id)
+
+    return posts, too_long
+
+
+# Threads are cached per viewer (posts carry you_starred and friends) under their root's id. A hit asks the api for
+# anything newer than the newest post we have with since_id at most once every CONVERSATION_CACHE_RECHECK seconds, so
+# new replies show up soon after, and the whole thread is reloaded once the entry is CONVERSATION_CACHE_TTL old to pick
+# up stars, reposts and deletes. Replying through create_post, or a write through the api proxy to a post we know the
+# thread of, bumps the thread's version which throws away every viewer's copy, and any write a viewer makes throws away
+# their own copies. A pickled post is a couple of kB, threads longer than CONVERSATION_CACHE_MAX_POSTS aren't cached so
+# an entry stays well clear of memcached's 1MB limit.
+CONVERSATION_CACHE_TTL = getattr(settings, 'CONVERSATION_CACHE_TTL', 5 * 60)
+CONVERSATION_CACHE_RECHECK = getattr(settings, 'CONVERSATION_CACHE_RECHECK', 30)
+CONVERSATION_CACHE_MAX_POSTS = getattr(settings, 'CONVERSATION_CACHE_MAX_POSTS', 250)
+
+
+def _conversation_version_key(thread_id):
+    return 'pau.bridge.conversation.version.%s' % thread_id
+
+
+def _conversation_cache_keys(request, thread_id):
+    "The viewer's entry, the flag saying their copy was checked for new posts lately, and the thread's version"
+    viewer = request.user.pk if request.user.is_authenticated() else 0
+
+    return ('pau.bridge.conversation.%s.%s' % (thread_id, viewer),
+            'pau.bridge.conversation.checked.%s.%s' % (thread_id, viewer),
+            _conversation_version_key(thread_id))
+
+
+def _conversation_thread_key(post_id):
+    return 'pau.bridge.conversation.thread_id.%s' % post_id
+
+
+def invalidate_conversation(thread_id):
+    cache.set(_conversation_version_key(thread_id), time.time(), CONVERSATION_CACHE_TTL)
+
+
+def _get_cached_conversation(request, thread_id, params, max_rounds):
+    "Returns the viewer's cached copy of the thread, or None, and the thread's current version."
+    entry_key, checked_key, version_key = _conversation_cache_keys(request, thread_id)
+    cached = cache.get_many([entry_key, checked_key, version_key])
+    entry, version = cached.get(entry_key), cached.get(version_key)
+    if not entry or entry['version'] != version or entry.get('viewer_version') != viewer_write_version(request):
+        return None, version
+
+    if entry['too_long'] or cached.get(checked_key):
+        return entry, version
+
+    new_posts, _, more = _fetch_thread_pages(request, thread_id, params, since_id=entry['max_id'], max_rounds=max_rounds - 1)
+    if more:
+        # a lot happened since we last looked, start over
+        return None, version
+
+    cache.set(checked_key, True, CONVERSATION_CACHE_RECHECK)
+    if new_posts:
+        posts_by_id = dict((p.id, p) for p in entry['posts'])
+        posts_by_id.update((p.id, p) for p in new_posts)
+        entry['posts'] = sorted(posts_by_id.itervalues(), key=lambda p: p.id)
+        entry['max_id'] = entry['posts'][-1].id
+        entry['too_long'] = len(entry['posts']) > max_rounds * params['count']
+        if entry['too_long']:
+            # keep the original expiry, the full reload is what catches everything since_id can't
+            cache.set(entry_key, dict(entry, posts=[]), max(int(entry['expires_at'] - time.time()), 1))
+        elif len(entry['posts']) > CONVERSATION_CACHE_MAX_POSTS:
+            graphite_count('omo.bridge.conversation_cache.too_big')
+            cache.delete(entry_key)
+        else:
+            cache.set(entry_key, entry, max(int(entry['expires_at'] - time.time()), 1))
+
+    return entry, version
+
+
+def _set_cached_conversation(request, post_id, thread_id, posts, too_long, version, viewer_version, started):
+    """
+    version and viewer_version are what they were before the thread was loaded, started is when that was. Storing those
+    means a write that lands while we load leaves the entry stale straight away, instead of it keeping what we got from
+    before the write.
+    """
+    # Which thread a post is in never changes. Only remember it for the post that was asked for though, a key for every
+    # post in a long thread would push everything else out of the cache.
+    cache.set(_conversation_thread_key(post_id), thread_id, 24 * 60 * 60)
+
+    if not too_long and len(posts) > CONVERSATION_CACHE_MAX_POSTS:
+        graphite_count('omo.bridge.conversation_cache.too_big')
+        return
+
+    entry_key, checked_key, version_key = _conversation_cache_keys(request, thread_id)
+    if version is None:
+        # we didn't know the thread before loading it, so there was no version to read then. A bump since we started
+        # could have been for a write our copy doesn't have.
+        version = cache.get(version_key)
+        if version and version >= started:
+            return
+
+    entry = {
+        'posts': [] if too_long else posts,
+        'max_id': posts[-1].id,
+        'too_long': too_long,
+        'version': version,
+        'viewer_version': viewer_version,
+        'expires_at': time.time() + CONVERSATION_CACHE_TTL,
+    }
+    cache.set(entry_key, entry, CONVERSATION_CACHE_TTL)
+    # we just loaded it, nothing to ask the api for yet
+    cache.set(checked_key, True, CONVERSATION_CACHE_RECHECK)
+
+
 @timer('omo.bridge.get_conversation')
 def get_conversation(request, post_id):
 
@@ -374,43 +984,303 @@ def get_conversation(request, post_id):
         'include_deleted': '1',
         'count': 200
     }
-    rounds = 0
+    # Threads that would take more than this many pages are too long to show, we just show the post
+    max_rounds = 8
+
+    started = time.time()
+    entry = version = None
+    viewer_version = viewer_write_version(request)
+    thread_id = cache.get(_conversation_thread_key(post_id))
+    if thread_id:
+        entry, version = _get_cached_conversation(request, thread_id, params, max_rounds)
+
+    if entry:
+        graphite_count('omo.bridge.conversation_cache.hit')
+        posts, too_long = entry['posts'], entry['too_long']
+    else:
+        graphite_count('omo.bridge.conversation_cache.miss')
+        posts, too_long = _load_conversation(request, post_id, params, max_rounds)
+        if posts and posts[0].get('thread_id'):
+            loaded_thread_id = int(posts[0].thread_id)
+            if loaded_thread_id != thread_id:
+                version = None
+            _set_cached_conversation(request, post_id, loaded_thread_id, posts, too_long, version, viewer_version,
+                                     started)
 
     # what we're returning
     before = []
     target = None
     after = []
 
-    for post_chunk in api.Stream(api.get_thread, request, post_id, params=params):
-        rounds += 1
-
-        if rounds > 8:
-            before = after = []
-            if target is None:
-                resp = api.get_post(request, post_id)
-                target = resp.data
-            break
-
-        for p in post_chunk.data:
+    if too_long:
+        target = next((p for p in posts if p.id == post_id), None)
+        if target is None:
+            resp = api.get_post(request, post_id)
+            target = resp.data
+    else:
+        for p in posts:
             if p.id < post_id:
-                before.insert(0, p)
+                before.append(p)
             elif p.id == post_id:
                 target = p
             else:
-                after.insert(0, p)
+                after.append(p)
+
     if not target:
         raise Http404()
 
     return before, target, after
 
 
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(size_setting, default_size):
+    pool = _pools.get(size_setting)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(size_setting)
+            if pool is None:
+                pool = _pools[size_setting] = ThreadPool(getattr(settings, size_setting, default_size))
+
+    return pool
+
+
+def _get_fan_out_pool():
+    return _get_pool('ALPHA_API_FAN_OUT_THREADS', 8)
+
+
+def get_api_proxy_batch_pool():
+    # the batch proxy can queue up to API_PROXY_BATCH_MAX_REQUESTS calls at once, on its own pool they can't hold up
+    # pages
+    return _get_pool('API_PROXY_BATCH_THREADS', 8)
+
+
+def _get_explore_streams_refresh_pool():
+    return _get_pool('EXPLORE_STREAMS_REFRESH_THREADS', 1)
+
+
+def _get_thread_pool():
+    # Work on this pool must never fan out again itself, or a busy process could end up with every worker waiting on a
+    # task that's queued behind it
+    return _get_pool('CONVERSATION_PREFETCH_THREADS', 8)
+
+
+_failure_order = itertools.count()
+
+
+def _run_pool_task(call, failures):
+    try:
+        return call()
+    except Exception:
+        # keep the traceback of the failing call, and the order failures happened in
+        failures.append((next(_failure_order), sys.exc_info()))
+        raise
+    finally:
+        # pool threads outlive requests, so nothing else would give back a database connection opened on one
+        close_old_connections()
+
+
+@timer('omo.bridge.fan_out')
+def fan_out(request, calls, pool=None):
+    """
+    Issue independent api calls at the same time and wait for all of them, so a page costs as much as its slowest call
+    instead of the sum of them. calls is a dict of name -> callable taking no arguments, the result is a dict of
+    name -> return value. If any call raises, the first exception to happen is re-raised here, with its traceback, once
+    everything has finished. Calls run on the shared fan out pool unless another pool is given.
+
+    The pool is made of plain threads, which gevent's monkey patching turns into greenlets.
+    """
+    if len(calls) < 2:
+        return dict((name, call()) for name, call in calls.iteritems())
+
+    # build the api wrapper on this thread so the workers don't race to create it
+    request.omo_api
+
+    pool = pool or _get_fan_out_pool()
+    failures = []
+    pending = [(name, pool.apply_async(_run_pool_task, (call, failures))) for name, call in calls.iteritems()]
+
+    results = {}
+    for name, async_result in pending:
+        try:
+            results[name] = async_result.get()
+        except Exception:
+            pass
+
+    if failures:
+        exc_type, exc_value, exc_traceback = min(failures)[1]
+        raise exc_type, exc_value, exc_traceback
+
+    return results
+
+
+# Posts and users read one at a time (the photo page, attachment redirects, profile lookups) are cached per viewer, since
+# posts carry you_starred and users you_follow. An entry holds the api's json, not objects, so every hit decodes its own.
+# The django cache keeps entries for OBJECT_CACHE_TTL and each process keeps its own copy for OBJECT_CACHE_LOCAL_TTL in
+# front of that, so a hot post doesn't cost even a cache round trip. A write that touches an object bumps its version,
+# which throws away every viewer's copy in the django cache and the ones in this process, other processes can go on
+# serving theirs for up to OBJECT_CACHE_LOCAL_TTL.
+OBJECT_CACHE_TTL = getattr(settings, 'OBJECT_CACHE_TTL', 60)
+OBJECT_CACHE_LOCAL_TTL = getattr(settings, 'OBJECT_CACHE_LOCAL_TTL', 5)
+_local_objects = LocalLRUCache(getattr(settings, 'OBJECT_CACHE_LOCAL_SIZE', 2048))
+
+
+def _object_version_key(kind, object_id):
+    return 'pau.bridge.object.version.%s.%s' % (kind, object_id)
+
+
+def _object_cache_key(request, kind, ref):
+    viewer = request.user.pk if request.user.is_authenticated() else 0
+    # call_api sends the page's query string along too, so it's part of what we got back
+    params = hashlib.md5(repr(sorted(request.GET.iteritems()))).hexdigest() if request.GET else ''
+
+    return 'pau.bridge.object.%s.%s.%s.%s' % (kind, ref, viewer, params)
+
+
+def _fetch_object(request, kind, cache_key, path, model, object_id=None):
+    # Read the version before asking the api, so a write that lands while we wait leaves the entry stale straight away
+    # instead of it keeping what we got from before the write.
+    started = time.time()
+    version = cache.get(_object_version_key(kind, object_id)) if object_id else None
+
+    content = api.call_api(request, path, raw_content=True)
+    # this raises for api errors, so only good responses are kept
+    response = decode_api_response(content, model=model, users=get_user_identity_map(request))
+
+    fetched_id = response.data.get('id') if response.data else None
+    if not fetched_id:
+        return None, response
+
+    if str(fetched_id) != str(object_id):
+        # Looked up by something other than its id (a username), so only now do we know which version to go by. A bump
+        # since we started could have been for a write our copy doesn't have, so don't keep it.
+        version = cache.get(_object_version_key(kind, fetched_id))
+        if version and version >= started:
+            return None, response
+
+    entry = {
+        'kind': kind,
+        'id': str(fetched_id),
+        'version': version,
+        'content': content,
+    }
+    cache.set(cache_key, entry, OBJECT_CACHE_TTL)
+
+    return entry, response
+
+
+def _get_cached_object(request, kind, ref, path, model, object_id=None):
+    cache_key = _object_cache_key(request, kind, ref)
+
+    entry = _local_objects.get(cache_key)
+    if entry:
+        graphite_count('omo.bridge.object_cache.local_hit')
+    else:
+        entry = cache.get(cache_key)
+        if entry and entry['version'] == cache.get(_object_version_key(kind, entry['id'])):
+            graphite_count('omo.bridge.object_cache.hit')
+        else:
+            graphite_count('omo.bridge.object_cache.miss')
+            entry, response = _fetch_object(request, kind, cache_key, path, model,
+                                            object_id=object_id or (entry and entry['id']))
+            if entry:
+                _local_objects.set(cache_key, entry, OBJECT_CACHE_LOCAL_TTL)
+            return response
+
+        _local_objects.set(cache_key, entry, OBJECT_CACHE_LOCAL_TTL)
+
+    return decode_api_response(entry['content'], model=model, users=get_user_identity_map(request))
+
+
+def invalidate_object(kind, object_id):
+    object_id = str(object_id)
+    cache.set(_object_version_key(kind, object_id), time.time(), OBJECT_CACHE_TTL)
+    _local_objects.delete_where(lambda key, entry: entry['kind'] == kind and entry['id'] == object_id)
+
+
+def invalidate_post(post_id):
+    invalidate_object('post', post_id)
+
+
+def invalidate_user(user_id):
+    invalidate_object('user', user_id)
+
+
+def invalidate_viewer(request):
+    if request.user.is_authenticated():
+        invalidate_user(request.user.adn_user.id)
+
+
+# A viewer's write version goes up whenever they write anything through us. Things cached or ETagged for one viewer
+# that a write could change without us knowing exactly which entry (a thread they starred a post in, a stream they
+# reposted into) carry it, so the viewer sees their own change right away.
+VIEWER_WRITE_VERSION_TTL = getattr(settings, 'VIEWER_WRITE_VERSION_TTL', 24 * 60 * 60)
+
+
+def _viewer_write_version_key(request):
+    return 'pau.bridge.viewer_version.%s' % request.user.pk
+
+
+def viewer_write_version(request):
+    if not request.user.is_authenticated():
+        return None
+
+    if not hasattr(request, '_viewer_write_version'):
+        request._viewer_write_version = cache.get(_viewer_write_version_key(request))
+
+    return request._viewer_write_version
+
+
+def note_viewer_write(request):
+    if request.user.is_authenticated():
+        request._viewer_write_version = time.time()
+        cache.set(_viewer_write_version_key(request), request._viewer_write_version, VIEWER_WRITE_VERSION_TTL)
+
+
+_POST_WRITE_RE = re.compile(r'^/posts/(\d+)(?:/(?:star|repost))?/?$')
+_USER_WRITE_RE = re.compile(r'^/users/(\d+|me)/(?:follow|mute|block)/?$')
+
+
+def invalidate_for_api_write(request, method, path):
+    """Throw away the cached posts, users and threads a write the js sent through the api proxy could have changed."""
+    if method == 'GET':
+        return
+
+    note_viewer_write(request)
+
+    match = _POST_WRITE_RE.match(path)
+    if match:
+        invalidate_post(match.group(1))
+        # stars, reposts and deletes show in the thread too, if we know which one it is
+        thread_id = cache.get(_conversation_thread_key(match.group(1)))
+        if thread_id:
+            invalidate_conversation(thread_id)
+        return
+
+    match = _USER_WRITE_RE.match(path)
+    if match:
+        if match.group(1) != 'me':
+            invalidate_user(match.group(1))
+        # follower and following counts, you_follow and you_muted are all on the viewer's side too
+        invalidate_viewer(request)
+    elif path.rstrip('/') == '/users/me':
+        invalidate_viewer(request)
+
+
 def get_post(request, post_id):
-    post = api.get_post(request, post_id).data
+    post = _get_cached_object(request, 'post', post_id, '/posts/%s' % post_id, APIPost, object_id=post_id).data
     if post.machine_only:
         return None
     return post
 
 
+def get_public_post(request, post_id):
+    "get_post for callers that need nothing viewer specific (you_starred and friends), everybody shares one entry."
+    return get_post(AppTokenRequest(secure=request.is_secure()), post_id)
+
+
 def global_stream(request):
     return api.posts_stream_global(request)
 
@@ -426,13 +1296,86 @@ def explore_stream(request, explore_slug):
     return resp
 
 
-def list_explore_streams(request):
+# The list of explore streams is the same for everybody, so it's cached for the whole process and in the django cache.
+# Once an entry is older than EXPLORE_STREAMS_TTL it's still served for up to EXPLORE_STREAMS_STALE_TTL while a
+# background refresh fetches a new one.
+EXPLORE_STREAMS_TTL = getattr(settings, 'EXPLORE_STREAMS_TTL', 5 * 60)
+EXPLORE_STREAMS_STALE_TTL = getattr(settings, 'EXPLORE_STREAMS_STALE_TTL', 60 * 60)
+_explore_streams = {}
+_explore_streams_refreshing = set()
+_explore_streams_lock = threading.Lock()
+
+
+def _explore_streams_cache_key(secure):
+    # smart_reverse only varies on whether the request is secure, so that's all the precomputed urls vary on
+    return 'pau.bridge.explore_streams.%d' % bool(secure)
+
+
+def _fetch_explore_streams(secure, cache_key):
+    # fetched on behalf of everybody, so nothing from the request that asked for it gets used
+    request = AppTokenRequest(secure=secure)
 
     def adjust_url(stream):
         stream['url'] = smart_reverse(request, 'explore', args=[stream['slug']])
         return stream
 
-    return map(adjust_url, api.list_explore_streams(request).data)
+    entry = {
+        'streams': map(adjust_url, api.list_explore_streams(request).data),
+        'fresh_until': time.time() + EXPLORE_STREAMS_TTL,
+    }
+    cache.set(cache_key, entry, EXPLORE_STREAMS_STALE_TTL)
+    _explore_streams[cache_key] = entry
+
+    return entry
+
+
+def _refresh_explore_streams(secure, cache_key):
+    try:
+        # only one worker anywhere needs to do this, everybody else keeps serving the stale copy
+        with cache_lock(cache_key, retry_count=1):
+            _fetch_explore_streams(secure, cache_key)
+    except CacheLockFailed:
+        pass
+    except Exception:
+        logger.exception('Failed to refresh explore streams')
+    finally:
+        with _explore_streams_lock:
+            _explore_streams_refreshing.discard(cache_key)
+        close_old_connections()
+
+
+@timer('omo.bridge.list_explore_streams')
+def list_explore_streams(request):
+    secure = request.is_secure()
+    cache_key = _explore_streams_cache_key(secure)
+    now = time.time()
+
+    entry = _explore_streams.get(cache_key)
+    if not entry or entry['fresh_until'] < now:
+        entry = cache.get(cache_key) or entry
+        if entry:
+            _explore_streams[cache_key] = entry
+
+    if not entry:
+        graphite_count('omo.bridge.explore_streams.miss')
+        try:
+            with cache_lock(cache_key):
+                # somebody else may have filled the cache while we were waiting on the lock
+                entry = cache.get(cache_key) or _fetch_explore_streams(secure, cache_key)
+        except CacheLockFailed:
+            entry = _fetch_explore_streams(secure, cache_key)
+        _explore_streams[cache_key] = entry
+    elif entry['fresh_until'] < now:
+        graphite_count('omo.bridge.explore_streams.stale')
+        with _explore_streams_lock:
+            start_refresh = cache_key not in _explore_streams_refreshing
+            _explore_streams_refreshing.add(cache_key)
+        if start_refresh:
+            _get_explore_streams_refresh_pool().apply_async(_refresh_explore_streams, (secure, cache_key))
+    else:
+        graphite_count('omo.bridge.explore_streams.hit')
+
+    return entry['streams']
 
 
 def user_stream(request, *args, **kwargs):
@@ -483,11 +1426,16 @@ def get_following(request, user):
 
 
 def get_user_by_username(request, username):
-    return api.get_user(request, '@%s' % username).data
+    return _get_cached_object(request, 'user', '@%s' % username.lower(), '/users/@%s' % username, APIUser).data
 
 
 def follow(request, target_user):
-    return api.follow(request, target_user)
+    try:
+        return api.follow(request, target_user)
+    finally:
+        invalidate_user(api_extract_id(target_user))
+        invalidate_viewer(request)
+        note_viewer_write(request)
 
 
 def attach_metadata_to_channel(channel):
@@ -520,7 +1468,7 @@ def handle_actions_blob(request, blob_dict):
             return
 
         try:
-            api.follow(request, user_id)
+            follow(request, user_id)
         except AlphaBadRequestAPIException:
             pass
 
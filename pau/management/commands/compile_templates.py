@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import CommandError, NoArgsCommand
+import jinja2
+
+from paucore.web.jinja2_django import Loader
+
+
+class Command(NoArgsCommand):
+    help = ('Compile every template under JINJA2_TEMPLATE_PACKAGES and JINJA2_TEMPLATE_DIRS into '
+            'JINJA2_BYTECODE_CACHE_DIR, so workers started after a deploy load bytecode instead of compiling.')
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        env = Loader().env
+
+        if env.bytecode_cache is None:
+            raise CommandError('JINJA2_BYTECODE_CACHE_DIR is not set, there is nowhere to put compiled templates.')
+
+        start_time = time.time()
+        compiled = 0
+        failed = []
+
+        for template_name in env.list_templates():
+            try:
+                env.get_template(template_name)
+            except jinja2.TemplateSyntaxError, e:
+                failed.append(template_name)
+                self.stderr.write('%s: %s (line %s)' % (template_name, e.message, e.lineno))
+            except UnicodeDecodeError:
+                # not a template, something else that lives next to them
+                if verbosity > 1:
+                    self.stdout.write('skipped %s' % template_name)
+            else:
+                compiled += 1
+                if verbosity > 1:
+                    self.stdout.write('compiled %s' % template_name)
+
+        if verbosity > 0:
+            self.stdout.write('Compiled %d templates into %s in %.2fs' % (compiled, env.bytecode_cache.directory,
+                                                                         time.time() - start_time))
+
+        if failed:
+            raise CommandError('%d templates failed to compile' % len(failed))
@@ -1,7 +1,129 @@
+import threading
+import time
+from cookielib import DefaultCookiePolicy
+
 from django.conf import settings
 from django.contrib.auth.middleware import AuthenticationMiddleware
 
 import adnpy
+from requests.adapters import HTTPAdapter
+
+
+class PooledApiTransport(object):
+    """
+    One adnpy api object (a requests Session) shared by every request in the process, so connections to
+    ALPHA_API_ROOT are kept alive between pages instead of paying for a TCP+TLS handshake on every api call.
+
+    Nothing visitor specific lives on the session: callers pass their Authorization header with each request, and
+    cookies the api sets are never kept, or they'd go out with everybody else's calls. At most pool_maxsize
+    connections per host are open at once, a request past that waits for one to come back. Pools that have sat idle
+    for longer than idle_timeout are dropped before the next request so we don't try to reuse sockets the other end
+    has already given up on, a streamed response counts as in use until it's closed.
+    """
+
+    def __init__(self, api_root, extra_headers=None, pool_connections=4, pool_maxsize=16, idle_timeout=60):
+        self.api = adnpy.api.build_api(api_root=api_root, verify_ssl=True, extra_headers=extra_headers)
+        self.api.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True)
+        self.api.mount('https://', self.adapter)
+        self.api.mount('http://', self.adapter)
+        self.idle_timeout = idle_timeout
+        self.last_used = time.time()
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def _checkout(self):
+        with self.lock:
+            now = time.time()
+            if self.in_flight == 0 and now - self.last_used > self.idle_timeout:
+                # closing the adapter only clears its pools, new connections get made on demand
+                self.adapter.close()
+            self.in_flight += 1
+            self.last_used = now
+
+    def _checkin(self):
+        with self.lock:
+            self.in_flight -= 1
+            self.last_used = time.time()
+
+    def _call(self, api_method, method, url, *args, **kwargs):
+        self._checkout()
+        try:
+            response = api_method(method, url, *args, **kwargs)
+        except:
+            self._checkin()
+            raise
+
+        if not kwargs.get('stream'):
+            self._checkin()
+            return response
+
+        # the body is still on the connection, it stays checked out until the caller closes the response
+        close = response.close
+        checked_in = []
+
+        def close_and_checkin():
+            try:
+                close()
+            finally:
+                if not checked_in:
+                    checked_in.append(True)
+                    self._checkin()
+
+        response.close = close_and_checkin
+        return response
+
+    def request(self, method, url, *args, **kwargs):
+        return self._call(self.api.request, method, url, *args, **kwargs)
+
+    def request_json(self, method, url, *args, **kwargs):
+        return self._call(self.api.request_json, method, url, *args, **kwargs)
+
+
+class TokenBoundApi(object):
+    """
+    The per request face of the pooled transport, adds this request's token and headers to every call. token_class is
+    'app' when that's the shared app token, so callers know the responses aren't specific to this visitor.
+    """
+
+    def __init__(self, transport, headers, token_class=None):
+        self.transport = transport
+        self.headers = headers
+        self.token_class = token_class
+
+    def _headers(self, kwargs):
+        headers = dict(self.headers)
+        headers.update(kwargs.get('headers') or {})
+        kwargs['headers'] = headers
+        return kwargs
+
+    def request(self, method, url, *args, **kwargs):
+        return self.transport.request(method, url, *args, **self._headers(kwargs))
+
+    def request_json(self, method, url, *args, **kwargs):
+        return self.transport.request_json(method, url, *args, **self._headers(kwargs))
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_api_transport():
+    global _transport
+
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                extra_headers = {
+                    'Host': 'api.%s' % settings.PARENT_HOST,
+                    'X-ADN-Proxied': '1',  # we never want to allow our server to make jsonp or CORS requests to the api
+                }
+                _transport = PooledApiTransport(settings.ALPHA_API_ROOT, extra_headers=extra_headers,
+                                                pool_connections=getattr(settings, 'ALPHA_API_POOL_CONNECTIONS', 4),
+                                                pool_maxsize=getattr(settings, 'ALPHA_API_POOL_MAXSIZE', 16),
+                                                idle_timeout=getattr(settings, 'ALPHA_API_POOL_IDLE_TIMEOUT', 60))
+
+    return _transport
 
 
 class LazyApi(object):
@@ -12,37 +134,36 @@ class LazyApi(object):
 
     @staticmethod
     # stolen from paniolo
-    def get_adn_api(access_token=None, headers=None):
-        verify_ssl = True
+    def get_adn_api(access_token=None, headers=None, token_class=None):
+        request_headers = {}
 
-        extra_headers = {
-            'Host': 'api.%s' % settings.PARENT_HOST,
-            'X-ADN-Proxied': '1',  # we never want to allow our server to make jsonp or CORS requests to the api
-        }
+        if access_token:
+            request_headers['Authorization'] = 'Bearer %s' % access_token
 
         if headers:
-            extra_headers.update(headers)
+            request_headers.update(headers)
 
-        return adnpy.api.build_api(api_root=settings.ALPHA_API_ROOT, access_token=access_token, verify_ssl=verify_ssl,
-                                   extra_headers=extra_headers)
+        return TokenBoundApi(get_api_transport(), request_headers, token_class=token_class)
 
     def __get__(self, request, obj_type=None):
         if not request:
             return
 
         if not hasattr(request, '_cached_api'):
-            # Build an adnpy api object. We really should save this on the request object so we're not recreating this object for every
-            # api request we make in one alpha request
+            # The underlying connections are shared by the whole process, this is just a cheap wrapper that knows which
+            # token to send, so build it once per alpha request.
             try:
                 token = request.session['OMG_NEW_TOKEN_SPOT_omo_oauth2_token']
+                token_class = 'user'
             except:
                 token = settings.APP_TOKEN
+                token_class = 'app'
 
             headers = {
                 'X-ADN-Migration-Overrides': self.enabled_migrations
             }
 
-            api = self.get_adn_api(access_token=token, headers=headers)
+            api = self.get_adn_api(access_token=token, headers=headers, token_class=token_class)
 
             request._cached_api = api
 
@@ -1,15 +1,18 @@
 import logging
 import re
 import pytz
+import simplejson as json
 from urlparse import urljoin, urlparse
 
+from django.conf import settings
 from django.core.urlresolvers import NoReverseMatch
 
 from paucore.utils.image import fit_to_box
 from paucore.utils.date import naturaldate
 from paucore.utils.data import intersperse
-from paucore.utils.presenters import AbstractPresenter, html, html_list_to_english
-from paucore.utils.web import smart_reverse, append_query_string
+from paucore.utils.htmlgen import CLEAN_TEXT_TYPES
+from paucore.utils.presenters import AbstractPresenter, FragmentCache, html, html_list_to_english
+from paucore.utils.web import smart_reverse
 
 from pau.utils.annotations import get_photo_annotations, get_video_annotations, get_place_annotation
 
@@ -18,8 +21,12 @@ logger = logging.getLogger(__name__)
 
 def build_tree_from_text_entity_pack(request, text_entity_pack, itemscope='https://join.app.net/schemas/Post', convert_new_lines=False):
     # adapted from omo models TextEntityPack.html
+    text = text_entity_pack.get('text', "")
+    # pieces of text the bridge already cleaned are clean too
+    text_type = type(text) if isinstance(text, CLEAN_TEXT_TYPES) else lambda piece: piece
+
     def entity_text(e):
-        return text_entity_pack['text'][e['pos']:e['pos'] + e['len']]
+        return text_type(text_entity_pack['text'][e['pos']:e['pos'] + e['len']])
 
     mention_builder = lambda m: html.a(
         itemprop='mention',
@@ -54,7 +61,7 @@ def build_tree_from_text_entity_pack(request, text_entity_pack, itemscope='https
     for entity_start, entity_len in sorted(entity_map.keys()):
         if text_idx != entity_start:
             # if our current place isn't the start of an entity, bring in text until the next entity
-            html_pieces.append(text_entity_pack.get('text', "")[text_idx:entity_start])
+            html_pieces.append(text_type(text[text_idx:entity_start]))
 
         # pull out the entity html
         entity_html = entity_map[(entity_start, entity_len)]
@@ -64,7 +71,7 @@ def build_tree_from_text_entity_pack(request, text_entity_pack, itemscope='https
         text_idx = entity_start + entity_len
 
     # clean up any remaining text
-    html_pieces.append(text_entity_pack.get('text', "")[text_idx:])
+    html_pieces.append(text_type(text[text_idx:]))
     if convert_new_lines:
         new_html_pieces = []
         for piece in html_pieces:
@@ -88,6 +95,10 @@ class FeedPostPresenter(AbstractPresenter):
     show_report_button = True
     show_delete_button = True
     hidden = False
+    # The post body (text and media) looks the same for every viewer, the same posts show up on global and explore for
+    # thousands of people so keep the trees we've built around. Header and footer have the viewer's buttons, timezone
+    # and relative timestamps in them so those are built every time.
+    post_body_cache = FragmentCache(maxsize=getattr(settings, 'POST_BODY_FRAGMENT_CACHE_SIZE', 2000))
 
     @classmethod
     def from_item(cls, request, post_a, show_deleted=False, single_post=False, show_stream_marker=False,
@@ -153,7 +164,7 @@ class FeedPostPresenter(AbstractPresenter):
 
         avatar_block = ''
         if self.post_a.user:
-            avatar_url = append_query_string(self.post_a.user.avatar_image.url, params={'w': avatar_size, 'h': avatar_size})
+            avatar_url = self.post_a.user.avatar_image.get_url(width=avatar_size, height=avatar_size)
             avatar_block = html.div(class_='media', *[
                 html.a(class_=avatar_classes, data=self.click_data, style={'background-image': 'url(%s)' % avatar_url},
                        href=self.user_detail_url)
@@ -163,12 +174,26 @@ class FeedPostPresenter(AbstractPresenter):
             html.div(class_='content', *[
                 avatar_block,
                 self.generate_post_header(),
-                self.generate_post_body(),
+                self.post_body_cache.get_or_generate(self.post_body_cache_key(), self.generate_post_body),
                 self.generate_post_footer()
             ]),
         ])
         return tree
 
+    def post_body_cache_key(self):
+        # everything generate_post_body looks at, the text, entities and annotations of a post never change
+        return (
+            self.__class__,
+            self.post_a.id,
+            bool(self.post_a.get('is_deleted')),
+            self.post_a.user.username if self.post_a.user else None,
+            self.request.is_secure(),
+            self.request.GET.get('max_width'),
+            self.request.GET.get('max_height'),
+            self.request.GET.get('include_zoom'),
+            json.dumps(self.click_data, sort_keys=True),
+        )
+
     def generate_post_header(self):
         username_block = html.span(class_='username')
 
@@ -754,7 +779,7 @@ class FeedInteractionPresenter(AbstractPresenter):
 
     def _generate_facepile(self, user):
         facepile_size = 40 * 2
-        facepile_img_url = append_query_string(user.avatar_image.url, params={'w': facepile_size, 'h': facepile_size})
+        facepile_img_url = user.avatar_image.get_url(width=facepile_size, height=facepile_size)
 
         facepile_block = html.a(href=self._user_link(user), *[
             html.img(class_=('interaction-facepile',), alt=user['username'], title=user['username'], src=facepile_img_url)
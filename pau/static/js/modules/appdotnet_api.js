@@ -255,6 +255,16 @@ window.APPDOTNET = (function () {
             var url = 'channels/' + channel_id + '/messages?include_annotations=1';
 
             return this.request(url, this.convert_to_json(options));
+        },
+        batch: function (requests) {
+            // requests is a list of {method: 'POST', path: 'posts/1/star', params: {}, data: {}}, the response is a
+            // list of {code: 200, body: {meta: {}, data: {}}} in the same order
+            var options = {
+                type: 'POST',
+                data: requests
+            };
+
+            return this.request('batch', this.convert_to_json(options));
         }
     };
 
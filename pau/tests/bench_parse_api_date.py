@@ -0,0 +1,38 @@
+"""
+Time parse_api_date against the iso8601 parser it replaced. Run it with the settings you'd run the site with:
+
+    python -m pau.tests.bench_parse_api_date
+"""
+import timeit
+
+from pau.tests.test_parse_api_date import iso8601_parse
+from pau.bridge import parse_api_date
+
+NUMBER = 100000
+VALUE = '2013-01-01T12:34:56Z'
+
+
+def main():
+    fast_path = parse_api_date.__wrapped__
+    # a page's worth of timestamps where most repeat, which is what the memoizing is for
+    page = ['2013-01-01T12:34:%02dZ' % (i % 40) for i in xrange(200)]
+
+    def memoized_page():
+        parse_api_date.cache_clear()
+        for value in page:
+            parse_api_date(value)
+
+    def iso8601_page():
+        for value in page:
+            iso8601_parse(value)
+
+    for name, fn, number in (('iso8601', lambda: iso8601_parse(VALUE), NUMBER),
+                             ('fast path', lambda: fast_path(VALUE), NUMBER),
+                             ('iso8601, page of 200', iso8601_page, NUMBER / 200),
+                             ('memoized, page of 200', memoized_page, NUMBER / 200)):
+        best = min(timeit.repeat(fn, number=number, repeat=3))
+        print '%-24s %8.2f usec per loop' % (name, best * 1e6 / number)
+
+
+if __name__ == '__main__':
+    main()
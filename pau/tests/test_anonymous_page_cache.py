@@ -0,0 +1,83 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+
+from pau.views.mixins import AnonymousPageCacheMixin
+
+
+class PageView(object):
+    "Renders a page with the visitor's csrf token and page timestamp in it, like the templates do"
+
+    def __init__(self, renders, headers=None, cookies=None):
+        self.renders = renders
+        self.headers = headers or {}
+        self.cookies = cookies or {}
+
+    def dispatch(self, request, *args, **kwargs):
+        self.renders.append(request.path)
+        request.js_timestamp = 1380000000000 + len(self.renders)
+        response = HttpResponse('<form><input name="csrfmiddlewaretoken" value="%s"></form><script>t=%s</script>' % (
+            get_token(request), request.js_timestamp))
+        for header, value in self.headers.iteritems():
+            response[header] = value
+        for name, value in self.cookies.iteritems():
+            response.set_cookie(name, value)
+
+        return response
+
+
+class CachedPageView(AnonymousPageCacheMixin, PageView):
+    pass
+
+
+class AnonymousPageCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.renders = []
+
+    def tearDown(self):
+        cache.clear()
+
+    def get(self, csrf_token, view=None, **extra):
+        request = RequestFactory().get('/hashtags/foo', **extra)
+        request.user = AnonymousUser()
+        request.session = {}
+        request.META['CSRF_COOKIE'] = csrf_token
+        return (view or CachedPageView(self.renders)).dispatch(request)
+
+    def test_hit_gets_the_visitors_own_token_and_timestamp(self):
+        first = self.get('a' * 32)
+        second = self.get('b' * 32)
+
+        self.assertEqual(self.renders, ['/hashtags/foo'])
+        self.assertIn('value="%s"' % ('b' * 32), second.content)
+        self.assertNotIn('a' * 32, second.content)
+        self.assertNotIn('__anonymous_page_cache', second.content)
+        self.assertNotIn('t=1380000000001', second.content)
+        self.assertIn('value="%s"' % ('a' * 32), first.content)
+
+    def test_per_visitor_responses_are_not_stored(self):
+        for view_kwargs in ({'headers': {'Vary': 'Cookie'}}, {'cookies': {'seen': '1'}}):
+            self.renders = []
+            self.get('a' * 32, CachedPageView(self.renders, **view_kwargs))
+            self.get('a' * 32, CachedPageView(self.renders, **view_kwargs))
+            self.assertEqual(len(self.renders), 2, view_kwargs)
+
+    def test_hit_answers_a_matching_etag_with_304(self):
+        self.get('a' * 32)
+        hit = self.get('a' * 32)
+        self.assertEqual(hit.status_code, 200)
+        self.assertTrue(hit['ETag'].startswith('W/"'))
+
+        not_modified = self.get('a' * 32, HTTP_IF_NONE_MATCH=hit['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], hit['ETag'])
+
+        # the etag has the visitor's csrf token in it, somebody else's copy is no good
+        other_visitor = self.get('b' * 32, HTTP_IF_NONE_MATCH=hit['ETag'])
+        self.assertEqual(other_visitor.status_code, 200)
+        self.assertEqual(self.renders, ['/hashtags/foo'])
@@ -0,0 +1,99 @@
+import threading
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+
+from pau import bridge
+
+
+class FakeResponse(object):
+
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeApi(object):
+    "Stands in for request.omo_api, every call waits until the test lets it go"
+
+    def __init__(self, token_class, error=None):
+        self.token_class = token_class
+        self.error = error
+        self.calls = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+
+    def request(self, method, path, params=None, headers=None, raw_response=False, **kwargs):
+        with self.lock:
+            self.calls.append(path)
+        self.entered.set()
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+
+        return FakeResponse('{"meta": {"code": 200}, "data": {"path": "%s"}}' % path)
+
+
+class CoalesceAppTokenGetsTest(SimpleTestCase):
+
+    def call_at_once(self, omo_api, num_calls=5):
+        results = [None] * num_calls
+
+        def call(i):
+            request = RequestFactory().get('/')
+            request.user = AnonymousUser()
+            request.omo_api = omo_api
+            try:
+                results[i] = bridge.api.call_api(request, '/posts/stream/global', params={'count': 20})
+            except Exception, e:
+                results[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in xrange(num_calls)]
+        threads[0].start()
+        omo_api.entered.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # give everybody else time to line up behind the first call
+        time.sleep(0.1)
+        omo_api.release.set()
+        for thread in threads:
+            thread.join(5)
+
+        return results
+
+    def test_identical_app_token_gets_share_one_call(self):
+        omo_api = FakeApi('app')
+        results = self.call_at_once(omo_api)
+
+        self.assertEqual(omo_api.calls, ['/posts/stream/global'])
+        for result in results:
+            self.assertEqual(result.data.path, '/posts/stream/global')
+        # each caller decodes its own copy
+        self.assertEqual(len(set(map(id, results))), len(results))
+
+    def test_exception_reaches_every_waiter(self):
+        error = IOError('connection reset')
+        omo_api = FakeApi('app', error=error)
+        results = self.call_at_once(omo_api)
+
+        self.assertEqual(len(omo_api.calls), 1)
+        self.assertEqual(results, [error] * len(results))
+
+    def test_user_token_calls_are_never_shared(self):
+        omo_api = FakeApi('user')
+        results = self.call_at_once(omo_api)
+
+        self.assertEqual(len(omo_api.calls), len(results))
+        for result in results:
+            self.assertEqual(result.data.path, '/posts/stream/global')
+
+    def test_nothing_is_kept_after_the_call(self):
+        omo_api = FakeApi('app')
+        omo_api.release.set()
+        self.call_at_once(omo_api, num_calls=1)
+        self.call_at_once(omo_api, num_calls=1)
+
+        self.assertEqual(len(omo_api.calls), 2)
+        self.assertEqual(bridge._in_flight_calls.calls, {})
@@ -0,0 +1,96 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+
+from pau import bridge
+from pau.bridge import APIPost
+
+
+def api_post(post_id, thread_id=100):
+    return APIPost.from_response_data({'id': str(post_id), 'thread_id': str(thread_id), 'text': 'post %s' % post_id,
+                                       'created_at': '2013-05-06T07:08:09Z'})
+
+
+class ConversationCacheTest(SimpleTestCase):
+    "get_conversation with the api calls it makes swapped for ones that record what was asked for"
+
+    def setUp(self):
+        cache.clear()
+        self.thread = [api_post(post_id) for post_id in (100, 101, 102)]
+        self.loads = []
+        self.fetches = []
+        self.new_posts = []
+        self.more = False
+        self.originals = bridge._load_conversation, bridge._fetch_thread_pages
+        bridge._load_conversation = self.load_conversation
+        bridge._fetch_thread_pages = self.fetch_thread_pages
+
+    def tearDown(self):
+        bridge._load_conversation, bridge._fetch_thread_pages = self.originals
+        cache.clear()
+
+    def load_conversation(self, request, post_id, params, max_rounds):
+        self.loads.append(post_id)
+        return list(self.thread), False
+
+    def fetch_thread_pages(self, request, post_id, params, since_id=None, before_id=None, max_rounds=8):
+        self.fetches.append(since_id)
+        return list(self.new_posts), None, self.more
+
+    def get_conversation(self, post_id=101):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        before, target, after = bridge.get_conversation(request, post_id)
+        return [p.id for p in before], target.id, [p.id for p in after]
+
+    def expire_recheck(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        cache.delete(bridge._conversation_cache_keys(request, 100)[1])
+
+    def test_hit_within_recheck_makes_no_api_calls(self):
+        self.assertEqual(self.get_conversation(), ([100], 101, [102]))
+        self.assertEqual(self.get_conversation(), ([100], 101, [102]))
+
+        self.assertEqual(self.loads, [101])
+        self.assertEqual(self.fetches, [])
+
+    def test_hit_after_recheck_merges_new_posts(self):
+        self.get_conversation()
+        self.expire_recheck()
+        self.new_posts = [api_post(103)]
+
+        self.assertEqual(self.get_conversation(), ([100], 101, [102, 103]))
+        self.assertEqual(self.fetches, [102])
+
+        # what was merged in is cached, and the check isn't repeated straight away
+        self.new_posts = []
+        self.assertEqual(self.get_conversation(), ([100], 101, [102, 103]))
+        self.assertEqual(self.fetches, [102])
+        self.assertEqual(self.loads, [101])
+
+    def test_reload_when_too_much_is_new(self):
+        self.get_conversation()
+        self.expire_recheck()
+        self.more = True
+        self.thread.append(api_post(104))
+
+        self.assertEqual(self.get_conversation(), ([100], 101, [102, 104]))
+        self.assertEqual(self.loads, [101, 101])
+
+    def test_reload_after_the_thread_changes(self):
+        self.get_conversation()
+        bridge.invalidate_conversation(100)
+        self.thread.append(api_post(104))
+
+        self.assertEqual(self.get_conversation(), ([100], 101, [102, 104]))
+        self.assertEqual(self.loads, [101, 101])
+        self.assertEqual(self.fetches, [])
+
+    def test_long_threads_are_not_cached(self):
+        self.thread = [api_post(post_id) for post_id in xrange(100, 101 + bridge.CONVERSATION_CACHE_MAX_POSTS)]
+        self.get_conversation()
+        self.get_conversation()
+
+        self.assertEqual(self.loads, [101, 101])
@@ -0,0 +1,53 @@
+import sys
+import threading
+import time
+import traceback
+
+from django.test import SimpleTestCase
+
+from pau.bridge import fan_out
+
+
+class FakeRequest(object):
+    omo_api = None
+
+
+class FanOutTest(SimpleTestCase):
+
+    def test_results_by_name(self):
+        calls = dict((name, lambda name=name: (name, threading.current_thread().name)) for name in ('a', 'b', 'c'))
+        results = fan_out(FakeRequest(), calls)
+
+        self.assertEqual(sorted(results), ['a', 'b', 'c'])
+        for name, (result, thread_name) in results.iteritems():
+            self.assertEqual(result, name)
+            self.assertNotEqual(thread_name, threading.current_thread().name)
+
+    def test_single_call_runs_inline(self):
+        results = fan_out(FakeRequest(), {'only': lambda: threading.current_thread().name})
+        self.assertEqual(results, {'only': threading.current_thread().name})
+
+    def test_first_failure_is_raised_after_everything_finishes(self):
+        finished = []
+
+        def fails_first():
+            raise KeyError('first')
+
+        def fails_later():
+            time.sleep(0.05)
+            raise ValueError('later')
+
+        def slow():
+            time.sleep(0.1)
+            finished.append(True)
+
+        try:
+            fan_out(FakeRequest(), {'first': fails_first, 'later': fails_later, 'slow': slow})
+        except KeyError, e:
+            self.assertEqual(e.args, ('first',))
+            # the traceback goes back to where the call raised, not just to fan_out
+            self.assertEqual(traceback.extract_tb(sys.exc_info()[2])[-1][2], 'fails_first')
+        else:
+            self.fail('fan_out swallowed the exception')
+
+        self.assertEqual(finished, [True])
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import copy
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+
+from paucore.utils.htmlgen import maker, render_etree_to_string, string_maker
+from paucore.utils.presenters import html
+
+from pau.bridge import APIPost, APIUser
+from pau.presenters import feed
+
+
+def api_user(user_id, username, **extra):
+    user = {
+        'id': str(user_id), 'username': username, 'name': 'Name %s' % username, 'created_at': '2013-01-02T03:04:05Z',
+        'avatar_image': {'url': 'https://example.com/avatar/%s.png' % user_id, 'width': 200, 'height': 200},
+        'cover_image': {'url': 'https://example.com/cover/%s.png' % user_id, 'width': 900, 'height': 300},
+        'counts': {'followers': 1, 'following': 2, 'stars': 3, 'posts': 4},
+        'description': {'text': 'hello', 'entities': {'mentions': [], 'hashtags': [], 'links': []}},
+        'timezone': 'America/New_York', 'you_follow': False, 'you_muted': False, 'type': 'human', 'annotations': [],
+    }
+    user.update(extra)
+    return user
+
+
+ALICE = api_user(1, 'alice')
+BOB = api_user(2, 'bob')
+
+
+def api_post(post_id, user, **extra):
+    text = u'post %s by @bob with <markup> & a snowman ☃' % post_id
+    post = {
+        'id': str(post_id), 'user': copy.deepcopy(user), 'created_at': '2013-05-06T07:08:09Z', 'text': text,
+        'source': {'name': 'Alpha', 'link': 'https://alpha.app.net', 'client_id': 'abc'},
+        'entities': {'mentions': [{'name': 'bob', 'id': '2', 'pos': text.index('@bob'), 'len': 4}], 'hashtags': [],
+                     'links': []},
+        'num_replies': 0, 'num_stars': 1, 'num_reposts': 0, 'thread_id': str(post_id), 'reply_to': None,
+        'you_starred': False, 'you_reposted': False, 'machine_only': False, 'starred_by': [], 'reposters': [],
+        'annotations': [],
+    }
+    post.update(extra)
+    return post
+
+
+POSTS = {
+    'plain': api_post(10, BOB),
+    'reply': api_post(11, BOB, reply_to='10', thread_id='10', num_replies=2),
+    'repost': api_post(12, BOB, repost_of=api_post(13, ALICE, num_reposts=1)),
+    'deleted': api_post(14, BOB, is_deleted=True),
+    'starred': api_post(15, BOB, you_starred=True, num_stars=4, starred_by=[copy.deepcopy(ALICE)]),
+    'own': api_post(16, ALICE, you_reposted=False, num_replies=1),
+    'muted author': api_post(17, api_user(3, 'carol', you_muted=True)),
+    'checkin': api_post(18, BOB, annotations=[
+        {'type': 'net.app.core.checkin', 'value': {'name': u'Café', 'address': '1 <St>', 'factual_id': 'abc'}},
+        {'type': 'net.app.core.crosspost', 'value': {'canonical_url': 'www.example.com/x?a=1&b=2'}},
+    ]),
+}
+
+
+class Viewer(object):
+    "Just enough of pau.models.User for the presenters"
+
+    def __init__(self, api_data):
+        self.pk = int(api_data['id'])
+        self.username = api_data['username']
+        self.adn_user = APIUser.from_response_data(dict(api_data, timezone='Europe/Berlin'))
+        self.preferences = type('Preferences', (object,), {'use_stream_markers': True})()
+
+    def is_authenticated(self):
+        return True
+
+
+def make_request(viewer, secure):
+    request = RequestFactory().get('/', **{'wsgi.url_scheme': 'https' if secure else 'http'})
+    request.user = viewer or AnonymousUser()
+    request.session = {}
+    return request
+
+
+PRESENTER_KWARGS = [
+    {},
+    {'single_post': True},
+    {'in_conversation': True, 'show_deleted': True, 'show_stream_marker': True},
+    {'click_data': {'x': 1, 'y': 'z'}, 'reply_link_format': 'to_post'},
+]
+
+
+class StringBackendTest(SimpleTestCase):
+    "FeedPostPresenter has to build the same post with the string backend as it does with lxml."
+
+    def setUp(self):
+        self.default_maker = html.maker
+
+    def tearDown(self):
+        html.maker = self.default_maker
+
+    def presenters(self, kwargs):
+        for viewer in (None, Viewer(ALICE)):
+            for secure in (False, True):
+                for name, data in sorted(POSTS.iteritems()):
+                    request = make_request(viewer, secure)
+                    label = '%s post, viewer %s, secure %s, %r' % (name, viewer and viewer.username, secure, kwargs)
+                    yield label, lambda: feed.FeedPostPresenter.from_item(request, APIPost.from_response_data(
+                        copy.deepcopy(data)), **kwargs)
+
+    def test_whole_post_matches_lxml(self):
+        for kwargs in PRESENTER_KWARGS:
+            for label, make_presenter in self.presenters(kwargs):
+                html.maker = maker
+                reference = make_presenter().generate_html()
+                html.maker = string_maker
+                built = make_presenter().generate_html()
+
+                self.assertEqual(render_etree_to_string(reference), render_etree_to_string(built), label)
+                self.assertEqual(len(reference), len(built), label)
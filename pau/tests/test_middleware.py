@@ -0,0 +1,61 @@
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from django.test import SimpleTestCase
+
+from pau.middleware import PooledApiTransport
+
+
+class CookieSettingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.seen_cookies.append(self.headers.get('Cookie'))
+        body = '{"meta": {"code": 200}, "data": {}}'
+        self.send_response(200)
+        self.send_header('Set-Cookie', 'visitor=alice; Path=/')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CookieSettingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class PooledApiTransportTest(SimpleTestCase):
+
+    def setUp(self):
+        self.server = CookieSettingServer(('127.0.0.1', 0), CookieSettingHandler)
+        self.server.seen_cookies = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.transport = PooledApiTransport('http://127.0.0.1:%d' % self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_response_cookies_are_not_sent_on_later_calls(self):
+        self.transport.request('GET', '/first', raw_response=True)
+        self.transport.request('GET', '/second', raw_response=True, headers={'Authorization': 'Bearer other'})
+
+        self.assertEqual(self.server.seen_cookies, [None, None])
+        self.assertEqual(len(self.transport.api.cookies), 0)
+
+    def test_streamed_response_is_in_flight_until_closed(self):
+        response = self.transport.request('GET', '/stream', raw_response=True, stream=True)
+        self.assertEqual(self.transport.in_flight, 1)
+
+        response.close()
+        response.close()
+        self.assertEqual(self.transport.in_flight, 0)
+
+        self.transport.request('GET', '/plain', raw_response=True)
+        self.assertEqual(self.transport.in_flight, 0)
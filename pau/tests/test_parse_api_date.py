@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from django.test import SimpleTestCase
+from iso8601 import parse_date
+
+from pau.bridge import parse_api_date
+
+
+def iso8601_parse(value):
+    # what parse_api_date did before it grew a fast path
+    return parse_date(value).replace(tzinfo=None)
+
+
+def outcome(parser, value):
+    try:
+        return parser(value)
+    except Exception, e:
+        return type(e)
+
+
+class ParseApiDateTest(SimpleTestCase):
+    valid = [
+        '2013-01-01T00:00:00Z',
+        '2012-02-29T23:59:59Z',
+        '1999-12-31T12:34:56Z',
+        u'2013-06-15T08:09:10Z',
+        # not the shape the api sends, these go through iso8601
+        '2013-01-01T00:00:00.123456Z',
+        '2013-01-01T00:00:00+02:00',
+        '2013-01-01 00:00:00Z',
+    ]
+
+    malformed = [
+        '',
+        'garbage',
+        '2013-01-01',
+        '2013-13-01T00:00:00Z',
+        '2013-02-30T00:00:00Z',
+        '2013-01-01T24:00:00Z',
+        '2013-01-01T00:60:00Z',
+        '2013-01-01T00:00:61Z',
+        '2013-+1-01T00:00:00Z',
+        '2013- 1-01T00:00:00Z',
+        '2013-01--1T00:00:00Z',
+        ' 013-01-01T00:00:00Z',
+        '0000-01-01T00:00:00Z',
+        u'٢٠١٣-01-01T00:00:00Z',
+    ]
+
+    def setUp(self):
+        parse_api_date.cache_clear()
+
+    def test_valid_timestamps_match_iso8601(self):
+        for value in self.valid:
+            self.assertEqual(parse_api_date(value), iso8601_parse(value), value)
+            self.assertIsNone(parse_api_date(value).tzinfo)
+
+    def test_malformed_timestamps_match_iso8601(self):
+        for value in self.malformed:
+            self.assertEqual(outcome(parse_api_date, value), outcome(iso8601_parse, value), repr(value))
+
+    def test_memoized_result_matches(self):
+        value = '2013-01-01T00:00:00Z'
+        self.assertIs(parse_api_date(value), parse_api_date(value))
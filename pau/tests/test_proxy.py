@@ -0,0 +1,156 @@
+import json
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+
+from pau import bridge
+from pau.views import proxy
+
+
+class ParseBatchItemTest(SimpleTestCase):
+
+    def test_normalizes(self):
+        self.assertEqual(proxy.parse_batch_item({'path': 'posts/1/star', 'method': 'post', 'data': {'x': 1}}), {
+            'method': 'POST', 'path': '/posts/1/star', 'params': {}, 'data': {'x': 1},
+        })
+        self.assertEqual(proxy.parse_batch_item({'path': '/users/me', 'params': {'count': 5}, 'data': {'x': 1}}), {
+            'method': 'GET', 'path': '/users/me', 'params': {'count': 5}, 'data': None,
+        })
+
+    def test_rejects(self):
+        for item in (
+            'posts',
+            {'method': 'GET'},
+            {'path': '/posts', 'method': 'PATCH'},
+            {'path': '/posts/stream?count=5'},
+            {'path': '/posts/stream#top'},
+            {'path': '/posts', 'method': 'POST'},
+            {'path': '//posts/', 'method': 'post'},
+            {'path': '/posts?x=/star', 'method': 'POST'},
+        ):
+            self.assertRaises(ValueError, proxy.parse_batch_item, item)
+
+
+class FakeUpstream(object):
+    "Just enough of a streamed requests response"
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.content = json.dumps(body)
+        self.headers = {'Content-Type': 'application/json', 'Content-Length': str(len(self.content))}
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return iter([self.content])
+
+    def close(self):
+        self.closed = True
+
+
+class ProxyTest(SimpleTestCase):
+    "ajax_api_proxy with the api call and the invalidation it does swapped for ones that record what happened"
+
+    def setUp(self):
+        self.upstream = None
+        self.invalidated = []
+        self.original_invalidate = bridge.invalidate_for_api_write
+        bridge.api.call_api = lambda request, path, **kwargs: self.upstream
+        bridge.invalidate_for_api_write = lambda request, method, path: self.invalidated.append((method, path))
+
+    def tearDown(self):
+        del bridge.api.call_api
+        bridge.invalidate_for_api_write = self.original_invalidate
+
+    def proxy(self, method, status_code, body):
+        self.upstream = FakeUpstream(status_code, body)
+        request = getattr(RequestFactory(), method.lower())('/omo-api-proxy/posts/1/star')
+        request.user = AnonymousUser()
+        return proxy.ajax_api_proxy(request, 'posts/1/star')
+
+    def test_successful_write_passes_through_and_invalidates(self):
+        body = {'meta': {'code': 200}, 'data': {'id': '1', 'you_starred': True}}
+        response = self.proxy('POST', 200, body)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(''.join(response.streaming_content)), body)
+        self.assertTrue(self.upstream.closed)
+        self.assertEqual(self.invalidated, [('POST', '/posts/1/star')])
+
+    def test_failed_write_raises_like_before_and_invalidates_nothing(self):
+        for status_code, exception in ((404, Http404), (403, PermissionDenied), (400, bridge.AlphaAPIException),
+                                       (500, bridge.AlphaAPIException)):
+            body = {'meta': {'code': status_code, 'error_message': 'nope'}}
+            self.assertRaises(exception, self.proxy, 'POST', status_code, body)
+            self.assertTrue(self.upstream.closed)
+
+        self.assertEqual(self.invalidated, [])
+
+
+class BatchTest(SimpleTestCase):
+    "The batch proxy with the api calls and the invalidation it does swapped for ones that record what happened"
+
+    def setUp(self):
+        self.responses = {}
+        self.invalidated = []
+        self.original_invalidate = bridge.invalidate_for_api_write
+        bridge.api.call_api = self.call_api
+        bridge.invalidate_for_api_write = lambda request, method, path: self.invalidated.append((method, path))
+
+    def tearDown(self):
+        del bridge.api.call_api
+        bridge.invalidate_for_api_write = self.original_invalidate
+
+    def call_api(self, request, path, params=None, data=None, method='GET', headers=None, request_params=True, **kwargs):
+        self.assertFalse(request_params)
+        response = self.responses[path]
+        if isinstance(response, Exception):
+            raise response
+
+        return response
+
+    def make_request(self, items):
+        request = RequestFactory().post('/omo-api-proxy-batch', json.dumps(items), content_type='application/json')
+        request.user = AnonymousUser()
+        request.omo_api = None
+        return request
+
+    def call_item(self, path, method='POST'):
+        return proxy.call_batch_item(self.make_request([]), {'method': method, 'path': path, 'params': {}, 'data': None}, {})
+
+    def test_error_envelopes(self):
+        self.responses = {
+            '/bad': bridge.AlphaAPIException(bridge.BridgeJSON({'meta': {'code': 400, 'error_message': 'Bad'}})),
+            '/missing': Http404(),
+            '/forbidden': PermissionDenied(),
+            '/broken': ValueError('connection reset'),
+        }
+
+        bad = self.call_item('/bad')
+        self.assertEqual(bad['code'], 400)
+        self.assertEqual(bad['body']['meta']['error_message'], 'Bad')
+        self.assertEqual(self.call_item('/missing'), {'code': 404, 'body': proxy.error_envelope(404, 'Not Found')})
+        self.assertEqual(self.call_item('/forbidden'), {'code': 403, 'body': proxy.error_envelope(403, 'Forbidden')})
+        self.assertEqual(self.call_item('/broken'), {'code': 502, 'body': proxy.error_envelope(502, 'Bad Gateway')})
+
+        # none of those wrote anything
+        self.assertEqual(self.invalidated, [])
+
+    def test_only_successful_calls_invalidate(self):
+        self.responses = {
+            '/posts/1/star': {'meta': {'code': 200}, 'data': {'id': '1'}},
+            '/posts/2/star': Http404(),
+            '/users/me': {'meta': {'code': 200}, 'data': {'id': '1'}},
+        }
+        items = [
+            {'method': 'POST', 'path': '/posts/1/star'},
+            {'method': 'POST', 'path': '/posts/2/star'},
+            {'method': 'GET', 'path': '/users/me'},
+        ]
+
+        response = proxy.ajax_api_proxy_batch(self.make_request(items))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['code'] for result in json.loads(response.content)], [200, 404, 200])
+        self.assertEqual(sorted(self.invalidated), [('GET', '/users/me'), ('POST', '/posts/1/star')])
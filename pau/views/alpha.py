@@ -1,4 +1,6 @@
 import logging
+from functools import partial
+
 from django.conf import settings
 import simplejson as json
 
@@ -20,11 +22,17 @@ from pau.presenters.user import UserFollowPresenter, FollowButtonPresenter
 from pau.utils.annotations import get_photo_annotations, get_attachment_annotations
 from pau.utils.urls import oembed_url
 from pau.views.base import PauMMLActionView
+from pau.views.mixins import AnonymousPageCacheMixin
 from pau.presenters.messages import PostCreatePresenter
 
 
 logger = logging.getLogger('pau')
 
+# Whether the plain post stream pages (global, your stream, mentions, explore and hashtags) are sent out as they render.
+# Nothing past the first chunk can turn into an error page any more, so it's only turned on for pages that are a list
+# of posts and little else.
+STREAM_PAGE_RESPONSES = getattr(settings, 'STREAM_PAGE_RESPONSES', True)
+
 
 class PauStreamBaseView(PauMMLActionView):
 
@@ -56,6 +64,12 @@ class PauStreamBaseView(PauMMLActionView):
     def get_presenter_for_item(self, request, item):
         return self.presenter.from_item(request, item, **self.presenter_kwargs)
 
+    def get_api_dependencies(self, request, *args, **kwargs):
+        dependencies = super(PauStreamBaseView, self).get_api_dependencies(request, *args, **kwargs)
+        obj = self.get_stream_object(request, *args, **kwargs)
+        dependencies['stream'] = partial(self.get_response_from_obj, request, obj)
+        return dependencies
+
     def populate_stream_marker_context(self, request, response):
         """
         take the original response from the API (bridge) and concatenate some post-marker items to it
@@ -99,9 +113,7 @@ class PauStreamBaseView(PauMMLActionView):
             self.view_ctx['item_presenters'] = item_presenters
 
     def populate_stream_context(self, request, *args, **kwargs):
-        obj = self.get_stream_object(request, *args, **kwargs)
-
-        response = self.get_response_from_obj(request, obj)
+        response = self.api_results['stream']
 
         self.view_ctx.response_meta = response.meta
 
@@ -121,6 +133,11 @@ class PauStreamBaseView(PauMMLActionView):
 
         self.populate_stream_presenters(request, response, use_stream_marker=use_stream_marker)
 
+    def get_etag_parts(self, request, *args, **kwargs):
+        parts = bridge.stream_etag_parts(getattr(self.view_ctx, 'response_meta', None))
+        # the stream doesn't move when the viewer stars, reposts or follows, but what we show them does
+        return parts and parts + (bridge.viewer_write_version(request),)
+
     def populate_context(self, request, *args, **kwargs):
         super(PauStreamBaseView, self).populate_context(request, *args, **kwargs)
         self.populate_stream_context(request, *args, **kwargs)
@@ -145,6 +162,7 @@ class PauStreamBaseView(PauMMLActionView):
 class PauGlobalView(PauStreamBaseView):
 
     template_name = 'pau/global.html'
+    stream_response = STREAM_PAGE_RESPONSES
     page_title = 'Global Feed - App.net'
     page_description = 'The Global Feed on App.net'
     selected_nav_page = 'global'
@@ -163,6 +181,7 @@ global_stream = PauGlobalView.as_view(stream_function=bridge.global_stream)
 class PauExploreStreamView(PauStreamBaseView):
 
     template_name = 'pau/explore.html'
+    stream_response = STREAM_PAGE_RESPONSES
     requires_auth = True
 
     def get_stream_object(self, request, explore_slug, *args, **kwargs):
@@ -184,6 +203,7 @@ explore_stream = PauExploreStreamView.as_view(stream_function=bridge.explore_str
 class PauStreamView(PauStreamBaseView):
 
     template_name = 'pau/user/stream.html'
+    stream_response = STREAM_PAGE_RESPONSES
     page_title = 'Your Stream - App.net'
     page_description = 'My stream'
     selected_nav_page = 'stream'
@@ -226,6 +246,7 @@ interactions = PauInteractionsView.as_view(stream_function=bridge.user_interacti
 class PauMentionsView(PauStreamBaseView):
 
     template_name = 'pau/user/mentions.html'
+    stream_response = STREAM_PAGE_RESPONSES
     page_title = 'Mentions - App.net'
     page_description = 'My Mentions on App.net'
     selected_nav_page = 'mentions'
@@ -247,7 +268,26 @@ class PauMentionsView(PauStreamBaseView):
 mentions = PauMentionsView.as_view(stream_function=bridge.mentions_stream)
 
 
-class PauStarsFromUserView(PauStreamBaseView):
+class PauOwnerStreamBaseView(PauStreamBaseView):
+    """
+    Streams that belong to the user named in the url. The stream endpoints accept @username, so the owner lookup and
+    the stream don't depend on each other and are fetched together.
+    """
+
+    def get_api_dependencies(self, request, *args, **kwargs):
+        dependencies = super(PauOwnerStreamBaseView, self).get_api_dependencies(request, *args, **kwargs)
+        dependencies['owner'] = partial(bridge.get_user_by_username, request, kwargs.get('username', ''))
+        return dependencies
+
+    def get_stream_object(self, request, *args, **kwargs):
+        return '@%s' % kwargs.get('username', '')
+
+    def process_api_results(self, request, *args, **kwargs):
+        super(PauOwnerStreamBaseView, self).process_api_results(request, *args, **kwargs)
+        self.view_ctx['owner'] = self.api_results['owner']
+
+
+class PauStarsFromUserView(PauOwnerStreamBaseView):
 
     template_name = 'pau/user/starred.html'
     page_title = 'Starred - App.net'
@@ -256,12 +296,6 @@ class PauStarsFromUserView(PauStreamBaseView):
     requires_auth = False
     selected_nav_page = 'stars'
 
-    def get_stream_object(self, request, *args, **kwargs):
-        owner_username = kwargs.get('username', '')
-        owner = bridge.get_user_by_username(request, owner_username)
-        self.view_ctx['owner'] = owner
-        return owner
-
     def populate_context(self, request, *args, **kwargs):
         super(PauStarsFromUserView, self).populate_context(request, *args, **kwargs)
         self.view_ctx.update_ctx({
@@ -319,18 +353,12 @@ class PauRepostersView(PauStreamBaseView):
 reposters = PauRepostersView.as_view(stream_function=bridge.get_reposters)
 
 
-class PauFollowsBaseView(PauStreamBaseView):
+class PauFollowsBaseView(PauOwnerStreamBaseView):
     requires_auth = False
     presenter = UserFollowPresenter
     show_new_post_box = False
     template_name = 'pau/user/follows.html'
 
-    def get_stream_object(self, request, *args, **kwargs):
-        owner_username = kwargs.get('username', '')
-        owner = bridge.get_user_by_username(request, owner_username)
-        self.view_ctx['owner'] = owner
-        return owner
-
     def populate_context(self, request, *args, **kwargs):
         super(PauFollowsBaseView, self).populate_context(request, *args, **kwargs)
 
@@ -363,9 +391,10 @@ class PauFollowsFromView(PauFollowsBaseView):
 follows_from = PauFollowsFromView.as_view(stream_function=bridge.get_following)
 
 
-class PauHashtagsView(PauStreamBaseView):
+class PauHashtagsView(AnonymousPageCacheMixin, PauStreamBaseView):
 
     template_name = 'pau/hashtags.html'
+    stream_response = STREAM_PAGE_RESPONSES
     selected_nav_page = None
     requires_auth = False
 
@@ -396,7 +425,7 @@ def user_name_for_title(name):
     return ''
 
 
-class PauUserDetailView(PauStreamBaseView):
+class PauUserDetailView(AnonymousPageCacheMixin, PauOwnerStreamBaseView):
 
     requires_auth = False
     template_name = 'pau/user/detail.html'
@@ -425,20 +454,18 @@ class PauUserDetailView(PauStreamBaseView):
                 # for display purposes, don't show www. in alpha
                 self.view_ctx['verified_domain'] = self.view_ctx['verified_domain'][4:]
 
-    def get_stream_object(self, request, username, *args, **kwargs):
-        user = bridge.get_user_by_username(request, username)
+    def process_api_results(self, request, *args, **kwargs):
+        super(PauUserDetailView, self).process_api_results(request, *args, **kwargs)
+        user = self.view_ctx['owner']
         if not user:
             raise Http404()
-        self.view_ctx['owner'] = user
         if request.user.is_authenticated() and request.user.adn_user.id != user.id:
-            self.post_create_pre_text = u'@%s' % (username)
+            self.post_create_pre_text = u'@%s' % (user.username)
         self.view_ctx['rss_link'] = 'https://api.app.net/feed/rss/users/%d/posts' % (user.id)
-        return user
 
     def populate_context(self, request, *args, **kwargs):
         super(PauUserDetailView, self).populate_context(request, *args, **kwargs)
 
-        # XXX: owner is set in the stream function which is wrong and needs to change
         owner = self.view_ctx['owner']
 
         self.update_context_for_owner(request, owner)
@@ -470,17 +497,22 @@ class PauUserDetailView(PauStreamBaseView):
 user_detail = PauUserDetailView.as_view(stream_function=bridge.user_posts)
 
 
-class PauPostDetailView(PauMMLActionView):
+class PauPostDetailView(AnonymousPageCacheMixin, PauMMLActionView):
 
     requires_auth = False
     template_name = 'pau/post/detail.html'
     include_mobile_nav_btn = True
 
+    def get_api_dependencies(self, request, *args, **kwargs):
+        dependencies = super(PauPostDetailView, self).get_api_dependencies(request, *args, **kwargs)
+        dependencies['conversation'] = partial(bridge.get_conversation, request, kwargs.get('post_id'))
+        return dependencies
+
     @timer('pau.post_detail.populate_context')
     def populate_context(self, request, *args, **kwargs):
         super(PauPostDetailView, self).populate_context(request, *args, **kwargs)
         post_id = kwargs.get('post_id')
-        before_post_objs, target_post_api_obj, after_post_objs = bridge.get_conversation(request, post_id)
+        before_post_objs, target_post_api_obj, after_post_objs = self.api_results['conversation']
 
         if target_post_api_obj.user and kwargs.get('username') != target_post_api_obj.user.username:
             new_url = smart_reverse(request, 'post_detail_view', kwargs={'username': target_post_api_obj.user.username,
@@ -547,6 +579,11 @@ class PauPostDetailView(PauMMLActionView):
 
         self.view_ctx['post_box_presenter'] = PostCreatePresenter.from_data(request, btn_action='Reply', reply_to=target_post_api_obj)
 
+    def get_etag_parts(self, request, *args, **kwargs):
+        before_post_objs, target_post_api_obj, after_post_objs = self.api_results['conversation']
+        parts = [bridge.post_etag_parts(p) for p in before_post_objs + [target_post_api_obj] + after_post_objs]
+        return parts + [bridge.viewer_write_version(request)]
+
 post_detail = PauPostDetailView.as_view()
 
 
@@ -557,13 +594,19 @@ def verify_post(username, post):
     return False
 
 
-class PauPhotoView(PauMMLActionView):
+class PauPhotoView(AnonymousPageCacheMixin, PauMMLActionView):
     template_name = 'pau/post/photo.html'
     page_title = 'Photo - App.net'
     requires_auth = False
 
+    def get_api_dependencies(self, request, *args, **kwargs):
+        dependencies = super(PauPhotoView, self).get_api_dependencies(request, *args, **kwargs)
+        dependencies['post'] = partial(bridge.get_post, request, kwargs.get('post_id'))
+        return dependencies
+
     def populate_context(self, request, username=None, post_id=None, photo_id=None, *args, **kwargs):
-        super(PauPhotoView, self).populate_context(request, *args, **kwargs)
+        super(PauPhotoView, self).populate_context(request, username=username, post_id=post_id, photo_id=photo_id, *args,
+                                                   **kwargs)
 
         try:
             post_id = int(post_id)
@@ -571,7 +614,7 @@ class PauPhotoView(PauMMLActionView):
         except:
             raise Http404()
 
-        post_api_obj = bridge.get_post(request, post_id)
+        post_api_obj = self.api_results['post']
         if not verify_post(username, post_api_obj):
             raise Http404()
 
@@ -621,7 +664,8 @@ def attachment(request, username, post_id, attachment_id):
     except:
         raise Http404()
 
-    post = bridge.get_post(request, post_id)
+    # only the annotations matter here, so this can be the copy every visitor shares
+    post = bridge.get_public_post(request, post_id)
     if not verify_post(username, post):
         raise Http404()
 
@@ -691,6 +735,14 @@ def create_post(request):
         return HttpResponse(json.dumps(e.response), content_type='application/json', status=e.response.meta.code)
 
     post_a = bridge.APIPost.from_response_data(response_json.data)
+    if post_a.reply_to:
+        # the thread has a new post, and the post it replies to a new reply count
+        bridge.invalidate_conversation(post_a.thread_id)
+        bridge.invalidate_post(post_a.reply_to)
+        bridge.invalidate_post(post_a.thread_id)
+    # the author's post count
+    bridge.invalidate_viewer(request)
+    bridge.note_viewer_write(request)
 
     presenter = FeedPostPresenter.from_item(request, post_a)
     response_json.data['html'] = render_etree_to_string(presenter.generate_html())
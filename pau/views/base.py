@@ -1,4 +1,5 @@
 import logging
+from functools import partial
 
 from django.conf import settings
 from django.contrib.auth import logout as auth_logout
@@ -26,8 +27,22 @@ class PauMMLActionView(OAuthLoginRequiredViewMixin, MMLActionView):
     selected_nav_page = None
     minify_html = False
 
+    def get_api_dependencies(self, request, *args, **kwargs):
+        """
+        The independent api calls this view needs, as a dict of name -> callable. They're issued together by
+        bridge.fan_out and the results are on self.api_results by the time process_api_results runs.
+        """
+        return {
+            'explore_streams': partial(bridge.list_explore_streams, request),
+        }
+
+    def process_api_results(self, request, *args, **kwargs):
+        pass
+
     def populate_context(self, request, *args, **kwargs):
         super(PauMMLActionView, self).populate_context(request, *args, **kwargs)
+        self.api_results = bridge.fan_out(request, self.get_api_dependencies(request, *args, **kwargs))
+        self.process_api_results(request, *args, **kwargs)
         self.view_ctx.update_ctx({
             '__js_page_load_hooks': ['utils.handle_resize', 'init_pau', 'init_post_delete', 'init_mute_user', 'init_post_report',
                                      'init_star_post', 'init_repost', 'pau.init_fixed_nav'],
@@ -38,7 +53,7 @@ class PauMMLActionView(OAuthLoginRequiredViewMixin, MMLActionView):
             '__js_subscribe_url': 'https://account.app.net/upgrade/',
             '__js_upgrade_storage_url': 'https://account.app.net/settings/upgrade/storage/',
             'selected_nav_page': self.selected_nav_page,
-            'explore_streams': bridge.list_explore_streams(request),
+            'explore_streams': self.api_results['explore_streams'],
             'report_post_form': ReportPostForm(),
         })
 
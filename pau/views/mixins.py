@@ -1,8 +1,16 @@
+import hashlib
 import logging
+import time
+from datetime import datetime
 
-from django.http import HttpResponseRedirect
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseRedirect
+from django.middleware.csrf import get_token
 
-from paucore.utils.web import smart_reverse
+from paucore.stats.statsd_client import graphite_count
+from paucore.utils.date import datetime_to_secs
+from paucore.utils.web import etag_matches, not_modified_response, smart_reverse, weak_etag
 from paucore.web.views import ViewMiddleware, EarlyReturn
 
 logger = logging.getLogger(__name__)
@@ -40,3 +48,156 @@ class OAuthLoginRequiredViewMixin(ViewMiddleware):
         except EarlyReturn, er:
             return er.response
         return super(OAuthLoginRequiredViewMixin, self).dispatch(request, *args, **kwargs)
+
+
+# A session that has been through oauth carries its api token here, see pau.middleware.LazyApi
+OAUTH_TOKEN_SESSION_KEY = 'OMG_NEW_TOKEN_SPOT_omo_oauth2_token'
+# What gets stored in place of the csrf token and the page timestamp of whoever rendered a cached page
+ANONYMOUS_CACHE_CSRF_PLACEHOLDER = '__anonymous_page_cache_csrf_token__'
+ANONYMOUS_CACHE_TIMESTAMP_PLACEHOLDER = '__anonymous_page_cache_timestamp__'
+# If the request re-rendering a stale page dies without saying so, somebody else gets a go after this long
+ANONYMOUS_CACHE_REVALIDATE_TIMEOUT = 60
+
+
+class AnonymousPageCacheMixin(object):
+    """
+    Serve whole GET responses for logged out visitors out of the django cache. Pages are keyed on the path and the
+    query params in anonymous_cache_params, a request with any other params (paging through a stream, say) or with an
+    oauth token in its session skips the cache entirely.
+
+    An entry is fresh for anonymous_cache_ttl seconds and is then served stale for up to anonymous_cache_stale_ttl
+    more while one request re-renders it, everybody else keeps getting the stale copy until the new one lands. Each
+    visitor's own csrf token and the current page timestamp are put back into the page on the way out, and a visitor
+    that already has the page gets a 304.
+
+    This runs inside the view, so what gets stored is the response before any middleware has seen it, and on a hit the
+    middleware runs again for the visitor in front of it. A response that sets cookies or a Vary header itself, or that
+    changed the session, is about that one visitor and isn't stored. This has to come before PauMMLActionView in the
+    bases so it sees the response with X-Build-Info already set.
+    """
+    anonymous_cache_ttl = getattr(settings, 'ANONYMOUS_PAGE_CACHE_TTL', 30)
+    anonymous_cache_stale_ttl = getattr(settings, 'ANONYMOUS_PAGE_CACHE_STALE_TTL', 5 * 60)
+    anonymous_cache_params = ('max_width', 'max_height', 'include_zoom', 'post_presenter')
+
+    def can_use_anonymous_cache(self, request):
+        if not getattr(settings, 'ANONYMOUS_PAGE_CACHE_ENABLED', True) or not self.anonymous_cache_ttl:
+            return False
+
+        if request.method != 'GET' or request.user.is_authenticated():
+            return False
+
+        if OAUTH_TOKEN_SESSION_KEY in request.session:
+            return False
+
+        if hasattr(request, 'unique_id'):
+            # the page carries the visitor's own tracking cookie value
+            return False
+
+        # utm_ and friends are only for the analytics javascript, everything else might change what the api sends back
+        return all(k in self.anonymous_cache_params or k.startswith('utm_') for k in request.GET)
+
+    def anonymous_cache_key(self, request):
+        key_params = sorted((k, request.GET[k]) for k in self.anonymous_cache_params if k in request.GET)
+        key = repr((settings.BUILD_INFO, request.get_host(), request.is_secure(), bool(request.META.get('HTTP_X_PJAX')),
+                    request.path, key_params))
+
+        return 'pau.anonymous_page.%s' % hashlib.md5(key).hexdigest()
+
+    def response_from_anonymous_cache(self, request, entry):
+        csrf_token = str(get_token(request))
+        # the same page for the same visitor (weak_etag brings in their csrf token) in the same ETag bucket
+        etag = weak_etag(request, entry['digest'])
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+
+        content = entry['content'].replace(ANONYMOUS_CACHE_CSRF_PLACEHOLDER, csrf_token)
+        content = content.replace(ANONYMOUS_CACHE_TIMESTAMP_PLACEHOLDER, str(datetime_to_secs(datetime.now()) * 1000))
+        response = HttpResponse(content, status=entry['status_code'])
+        for header, value in entry['headers']:
+            response[header] = value
+        response['ETag'] = etag
+
+        return response
+
+    def can_store_anonymous_cache_entry(self, request, response):
+        if response.status_code != 200 or response.cookies or response.has_header('Vary'):
+            return False
+
+        # the session middleware would send this visitor a cookie for it, and it'd be somebody else's page
+        return not getattr(getattr(request, 'session', None), 'modified', False)
+
+    def store_anonymous_cache_entry(self, request, cache_key, response, content):
+        csrf_token = request.META.get('CSRF_COOKIE')
+        if csrf_token:
+            content = content.replace(str(csrf_token), ANONYMOUS_CACHE_CSRF_PLACEHOLDER)
+
+        # set by paucore.web.context_processors.default_jscontext
+        timestamp = getattr(request, 'js_timestamp', None)
+        if timestamp:
+            content = content.replace(str(timestamp), ANONYMOUS_CACHE_TIMESTAMP_PLACEHOLDER)
+
+        entry = {
+            'content': content,
+            'digest': hashlib.md5(content).hexdigest(),
+            'status_code': response.status_code,
+            # the ETag has the csrf token of whoever rendered it baked in, so it isn't anybody else's to send
+            'headers': [(header, value) for header, value in response.items() if header.lower() != 'etag'],
+            'fresh_until': time.time() + self.anonymous_cache_ttl,
+        }
+        cache.set(cache_key, entry, self.anonymous_cache_ttl + self.anonymous_cache_stale_ttl)
+
+    def stream_into_anonymous_cache(self, request, cache_key, response, streaming_content, revalidate_key):
+        chunks = []
+        try:
+            for chunk in streaming_content:
+                chunks.append(chunk)
+                yield chunk
+            # only a page that made it all the way out gets cached, not one the visitor walked away from
+            self.store_anonymous_cache_entry(request, cache_key, response, ''.join(chunks))
+        finally:
+            self.release_anonymous_cache_revalidate(revalidate_key)
+
+    def release_anonymous_cache_revalidate(self, revalidate_key):
+        if revalidate_key:
+            cache.delete(revalidate_key)
+
+    def render_into_anonymous_cache(self, request, cache_key, revalidate_key, *args, **kwargs):
+        try:
+            response = super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+        except:
+            self.release_anonymous_cache_revalidate(revalidate_key)
+            raise
+
+        if not self.can_store_anonymous_cache_entry(request, response):
+            self.release_anonymous_cache_revalidate(revalidate_key)
+        elif response.streaming:
+            response.streaming_content = self.stream_into_anonymous_cache(request, cache_key, response,
+                                                                          response.streaming_content, revalidate_key)
+        else:
+            self.store_anonymous_cache_entry(request, cache_key, response, response.content)
+            self.release_anonymous_cache_revalidate(revalidate_key)
+
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.can_use_anonymous_cache(request):
+            return super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+
+        cache_key = self.anonymous_cache_key(request)
+        revalidate_key = None
+        entry = cache.get(cache_key)
+
+        if not entry:
+            graphite_count('pau.anonymous_page_cache.miss')
+        elif entry['fresh_until'] >= time.time():
+            graphite_count('pau.anonymous_page_cache.hit')
+            return self.response_from_anonymous_cache(request, entry)
+        elif cache.add('%s.revalidate' % cache_key, 1, ANONYMOUS_CACHE_REVALIDATE_TIMEOUT):
+            # this request gets to re-render the page, everyone else is served the stale copy in the meantime
+            graphite_count('pau.anonymous_page_cache.revalidate')
+            revalidate_key = '%s.revalidate' % cache_key
+        else:
+            graphite_count('pau.anonymous_page_cache.stale')
+            return self.response_from_anonymous_cache(request, entry)
+
+        return self.render_into_anonymous_cache(request, cache_key, revalidate_key, *args, **kwargs)
@@ -1,13 +1,61 @@
 import json
+import logging
+from functools import partial
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, StreamingHttpResponse
+
+from paucore.utils.python import cast_int
+from paucore.utils.web import etag_matches, not_modified_response, weak_etag
 
 from pau import bridge
 
+logger = logging.getLogger(__name__)
+
 PASS_THROUGH_HEADERS = (
     ('HTTP_X_ADN_MIGRATION_OVERRIDES', 'X-Adn-Migration-Overrides'),
 )
 
+# GET responses bigger than this (or of unknown size) are streamed to the client as they come in instead of being decoded
+API_PROXY_PASS_THROUGH_BYTES = getattr(settings, 'API_PROXY_PASS_THROUGH_BYTES', 256 * 1024)
+API_PROXY_CHUNK_SIZE = getattr(settings, 'API_PROXY_CHUNK_SIZE', 16 * 1024)
+
+# How many sub-requests one batch may carry, they all share the batch pool with everybody else's batches
+API_PROXY_BATCH_MAX_REQUESTS = getattr(settings, 'API_PROXY_BATCH_MAX_REQUESTS', 20)
+
+
+def pass_through_headers(request):
+    headers = {}
+    for dj_header, header in PASS_THROUGH_HEADERS:
+        if dj_header in request.META:
+            headers[header] = request.META[dj_header]
+
+    return headers
+
+
+def should_pass_through(request, upstream):
+    # Only GETs can be answered with a 304, and for that we need the meta out of the body. Big ones go straight through
+    # anyway, holding them decoded and re-encoded costs more than the odd 304 saves.
+    if request.method != 'GET':
+        return True
+
+    content_length = cast_int(upstream.headers.get('Content-Length'), None)
+    return content_length is None or content_length > API_PROXY_PASS_THROUGH_BYTES
+
+
+def pass_through_response(upstream):
+    """Send the api's status and body on as they come in, without decoding them."""
+    def body():
+        try:
+            for chunk in upstream.iter_content(API_PROXY_CHUNK_SIZE):
+                yield chunk
+        finally:
+            upstream.close()
+
+    return StreamingHttpResponse(body(), status=upstream.status_code,
+                                 content_type=upstream.headers.get('Content-Type', 'application/json'))
+
 
 def ajax_api_proxy(request, path, *args, **kwargs):
     data = request.POST
@@ -21,19 +69,121 @@ def ajax_api_proxy(request, path, *args, **kwargs):
         except:
             pass
 
-    headers = {}
     files = {}
 
     for file_slug, f in request.FILES.iteritems():
         files[file_slug] = (f.name, f, f.content_type)
 
-    for dj_header, header in PASS_THROUGH_HEADERS:
-        if dj_header in request.META:
-            headers[header] = request.META[dj_header]
+    headers = pass_through_headers(request)
 
     path = '/' + path
 
-    resp = bridge.api.call_api(request, path, params=request.GET, data=data, method=request.method, headers=headers,
-                               post_type=post_type, files=files)
+    upstream = bridge.api.call_api(request, path, params=request.GET, data=data, method=request.method, headers=headers,
+                                   post_type=post_type, files=files, stream=True)
+
+    # Errors are small, decode them so they turn into the same exceptions they always have
+    if upstream.status_code == 200 and should_pass_through(request, upstream):
+        bridge.invalidate_for_api_write(request, request.method, path)
+        return pass_through_response(upstream)
+
+    try:
+        resp = bridge.decode_api_response(upstream.content)
+    finally:
+        upstream.close()
+
+    bridge.invalidate_for_api_write(request, request.method, path)
+
+    etag = None
+    if request.method == 'GET' and resp['meta']['code'] == 200:
+        parts = bridge.stream_etag_parts(resp.get('meta'))
+        if parts is not None:
+            etag = weak_etag(request, parts + (bridge.viewer_write_version(request),))
+            if etag_matches(request, etag):
+                return not_modified_response(etag)
+
+    response = HttpResponse(json.dumps(resp), content_type="application/json", status=resp['meta']['code'])
+    if etag:
+        response['ETag'] = etag
+
+    return response
+
+
+def error_envelope(code, error_message):
+    return {
+        'meta': {
+            'code': code,
+            'error_message': error_message,
+        }
+    }
+
+
+def call_batch_item(request, item, headers):
+    try:
+        # the batch's own query string is nothing to do with the calls in it
+        resp = bridge.api.call_api(request, item['path'], params=item['params'], data=item['data'], method=item['method'],
+                                   headers=headers, request_params=False)
+    except bridge.AlphaAPIException, e:
+        return {'code': e.response.meta.code, 'body': e.response}
+    except Http404:
+        return {'code': 404, 'body': error_envelope(404, 'Not Found')}
+    except PermissionDenied:
+        return {'code': 403, 'body': error_envelope(403, 'Forbidden')}
+    except Exception:
+        logger.exception('Batched api call to %s %s failed', item['method'], item['path'])
+        return {'code': 502, 'body': error_envelope(502, 'Bad Gateway')}
+
+    code = resp['meta']['code']
+    if 200 <= code < 300:
+        # only a write that happened can have made anything stale
+        bridge.invalidate_for_api_write(request, item['method'], item['path'])
+
+    return {'code': code, 'body': resp}
+
+
+def parse_batch_item(item):
+    if not isinstance(item, dict) or not isinstance(item.get('path'), basestring):
+        raise ValueError('Every request needs a path')
+
+    method = item.get('method', 'GET').upper()
+    if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+        raise ValueError('Unsupported method %s' % method)
+
+    path = '/' + item['path'].lstrip('/')
+    if '?' in path or '#' in path:
+        # a query string could also sneak a POST to /posts past the check below
+        raise ValueError('Pass query parameters in params, not in the path')
+
+    if method == 'POST' and path.rstrip('/') == '/posts':
+        # creating a post renders its html and invalidates the thread, that only happens in pau.views.alpha.create_post
+        raise ValueError('Create posts through omo-api-proxy/posts')
+
+    return {
+        'method': method,
+        'path': path,
+        'params': item.get('params') or {},
+        'data': item.get('data') if method in ('POST', 'PUT') else None,
+    }
+
+
+def ajax_api_proxy_batch(request):
+    """
+    Several api calls in one round trip. The body is a json list of {"method", "path", "params", "data"} objects, data
+    is sent on as json. They're all issued at once and the answer is a json list in the same order of
+    {"code": <the api's status code>, "body": <the api's response>}, one failed call doesn't fail the rest.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(('POST',))
+
+    try:
+        items = map(parse_batch_item, json.loads(request.body))
+    except (TypeError, ValueError), e:
+        return HttpResponseBadRequest('Malformed batch: %s' % e)
+
+    if len(items) > API_PROXY_BATCH_MAX_REQUESTS:
+        return HttpResponseBadRequest('At most %d requests per batch' % API_PROXY_BATCH_MAX_REQUESTS)
+
+    headers = pass_through_headers(request)
+    calls = dict((i, partial(call_batch_item, request, item, headers)) for i, item in enumerate(items))
+    results = bridge.fan_out(request, calls, pool=bridge.get_api_proxy_batch_pool())
 
-    return HttpResponse(json.dumps(resp), content_type="application/json", status=resp['meta']['code'])
+    return HttpResponse(json.dumps([results[i] for i in xrange(len(items))]), content_type='application/json')
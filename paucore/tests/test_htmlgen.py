@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from django.test import SimpleTestCase
+
+from paucore.utils.htmlgen import (HtmlGen, IMPROPER_HTML_ENCODING, get_default_maker, maker, render_etree_to_string,
+                                   sanitize_text, string_maker)
+
+
+class DefaultMakerTest(SimpleTestCase):
+
+    def test_lxml_unless_string_is_asked_for(self):
+        with self.settings(HTMLGEN_BACKEND='lxml'):
+            self.assertIs(get_default_maker(), maker)
+
+        with self.settings(HTMLGEN_BACKEND='string'):
+            self.assertIs(get_default_maker(), string_maker)
+
+
+class SanitizeTextTest(SimpleTestCase):
+
+    def test_matches_the_regex(self):
+        for text in ('plain', 'tab\tnew\nline\r', 'bell\x07 nul\x00 esc\x1b', u'plain', u'bell\x07 nul\x00\n',
+                     u'caf\xe9 \x07', u'☃ snowman\x1f', u'emoji \U0001f600\x00', u'bad \ufffe \ud800', u''):
+            sanitized = sanitize_text(text)
+            self.assertEqual(sanitized, IMPROPER_HTML_ENCODING.sub('', text), repr(text))
+            self.assertIs(type(sanitized), type(text), repr(text))
+
+    def test_clean_unicode_comes_back_as_is(self):
+        text = u'nothing to strip here'
+        self.assertIs(sanitize_text(text), text)
+
+
+class MakerParityTest(SimpleTestCase):
+    "The string backend has to produce exactly the markup lxml would have, whatever gets built with it."
+
+    def assertSameMarkup(self, build):
+        lxml_markup = render_etree_to_string(build(HtmlGen(maker=maker)))
+        string_markup = render_etree_to_string(build(HtmlGen(maker=string_maker)))
+        self.assertEqual(lxml_markup, string_markup)
+
+    def test_escaping(self):
+        for text in ('plain', 'a & b', '<script>alert(1)</script>', '"double" \'single\'', '&amp; already', '>', '&{x};'):
+            self.assertSameMarkup(lambda html: html.div(text))
+            self.assertSameMarkup(lambda html: html.span(title=text))
+            self.assertSameMarkup(lambda html: html.div({'data-x': text}, class_='c'))
+
+        self.assertSameMarkup(lambda html: html.span(title='both " and \''))
+        self.assertSameMarkup(lambda html: html.div('control\x00chars\x1f\x08 go'))
+
+    def test_raw_text_tags(self):
+        self.assertSameMarkup(lambda html: html.script('if (a < b && c > d) { x = "</p>"; }'))
+        self.assertSameMarkup(lambda html: html.style('a > b { content: "&"; }'))
+
+    def test_uri_attributes(self):
+        for url in ('https://example.com/a?b=1&c=2', ' \t\nhttps://example.com/leading', 'http://x/a b"c<d>',
+                    u'https://example.com/caf\xe9', u'https://example.com/\U0001f600', 'javascript:alert(1)',
+                    '/relative/path#frag'):
+            self.assertSameMarkup(lambda html: html.a('link', href=url))
+            self.assertSameMarkup(lambda html: html.img(src=url))
+            self.assertSameMarkup(lambda html: html.form(action=url))
+
+        self.assertSameMarkup(lambda html: html.a(name='has space'))
+        self.assertSameMarkup(lambda html: html.input(name='has space'))
+
+    def test_void_and_empty_tags(self):
+        for tag in ('br', 'hr', 'img', 'input', 'meta', 'link', 'area', 'col', 'param'):
+            self.assertSameMarkup(lambda html: html.div(getattr(html, tag)()))
+            self.assertSameMarkup(lambda html: getattr(html, tag)(class_='x'))
+
+        for tag in ('div', 'span', 'a', 'p', 'textarea', 'script', 'iframe', 'li', 'td', 'option'):
+            self.assertSameMarkup(lambda html: getattr(html, tag)())
+            self.assertSameMarkup(lambda html: html.div(getattr(html, tag)(), 'tail'))
+
+        self.assertSameMarkup(lambda html: html.input(type_='checkbox', checked='checked', disabled='disabled'))
+
+    def test_unicode(self):
+        for text in (u'caf\xe9', u'☃ snowman', u'emoji \U0001f600', u'rtl שלום', u'﻿bom'):
+            self.assertSameMarkup(lambda html: html.p(text, title=text))
+            self.assertSameMarkup(lambda html: html.div(html.span(text), text, class_=('a', u'b\xe9')))
+
+    def test_structure(self):
+        self.assertSameMarkup(lambda html: html.ul(*[html.li(str(i), class_='item', data={'n': i}) for i in range(5)]))
+        self.assertSameMarkup(lambda html: html.div('a', html.b('b'), 'c', html.i('d'), 'e', id_='x', style={'color': 'red'}))
+        self.assertSameMarkup(lambda html: html.div({'title': 'first'}, {'title': 'second', 'lang': 'en'}, 'text'))
+        self.assertSameMarkup(lambda html: html.div(['a', html.br(), 'b']))
+        self.assertSameMarkup(lambda html: html.div('x ', html.entity('nbsp'), ' y'))
+
+    def test_len_counts_child_elements(self):
+        for html in (HtmlGen(maker=maker), HtmlGen(maker=string_maker)):
+            self.assertEqual(len(html.div('text', html.span('a'), html.br(), 'more')), 2)
+            self.assertEqual(len(html.div('text only')), 0)
+
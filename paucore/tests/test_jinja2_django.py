@@ -0,0 +1,34 @@
+import jinja2
+from django.test import SimpleTestCase
+
+from paucore.web.jinja2_django import StripWhitespaceExtension
+
+
+def render(source, name='page.html', **ctx):
+    env = jinja2.Environment(loader=jinja2.DictLoader({name: source}), extensions=[StripWhitespaceExtension])
+    return env.get_template(name).render(**ctx)
+
+
+class StripWhitespaceExtensionTest(SimpleTestCase):
+
+    def test_indentation_and_comments_go(self):
+        source = '<div>\n    <p>{{ text }}</p>   \n\n    <!-- one line -->\n    <!--\n      two\n      lines\n    -->\n</div>'
+        self.assertEqual(render(source, text='hi'), '<div>\n<p>hi</p>\n</div>')
+
+    def test_conditional_comments_stay(self):
+        source = '<head>\n  <!--[if lt IE 9]>\n  <script src="shiv.js"></script>\n  <![endif]-->\n</head>'
+        self.assertIn('<!--[if lt IE 9]>', render(source))
+
+    def test_preformatted_text_is_left_alone(self):
+        for tag in ('pre', 'textarea', 'script', 'PRE'):
+            inner = '\n    keep   this\n\n        <!-- and this -->\n    var s = "a\\\n        b";\n'
+            source = '<div>\n    <%s class="x">%s</%s>\n    <p>\n        after\n    </p>\n</div>' % (tag, inner, tag)
+            self.assertEqual(render(source), '<div>\n<%s class="x">%s</%s>\n<p>\nafter\n</p>\n</div>' % (tag, inner, tag))
+
+    def test_preformatted_text_across_template_tags(self):
+        source = '<pre>\n    {% if show %}\n    kept\n    {% endif %}\n</pre>\n    <p>\n    x</p>'
+        self.assertEqual(render(source, show=True), '<pre>\n    \n    kept\n    \n</pre>\n<p>\nx</p>')
+
+    def test_only_html_templates(self):
+        source = 'line one\n    line two'
+        self.assertEqual(render(source, name='message.txt'), source)
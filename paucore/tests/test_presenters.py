@@ -0,0 +1,56 @@
+from django.test import SimpleTestCase
+
+from paucore.utils.htmlgen import HtmlGen, maker, render_etree_to_string, string_maker
+from paucore.utils.presenters import FragmentCache
+
+
+class FragmentCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.built = []
+
+    def builder(self, html):
+        def build():
+            self.built.append(True)
+            return html.div(html.span('cached'), class_='body')
+
+        return build
+
+    def test_hit_skips_the_builder(self):
+        for html in (HtmlGen(maker=maker), HtmlGen(maker=string_maker)):
+            self.built = []
+            fragment_cache = FragmentCache()
+            first = fragment_cache.get_or_generate('key', self.builder(html))
+            second = fragment_cache.get_or_generate('key', self.builder(html))
+
+            self.assertEqual(self.built, [True])
+            self.assertEqual(render_etree_to_string(first), render_etree_to_string(second))
+
+    def test_lxml_trees_are_copied_for_each_caller(self):
+        html = HtmlGen(maker=maker)
+        fragment_cache = FragmentCache()
+        first = fragment_cache.get_or_generate('key', self.builder(html))
+        html.div(first)
+        first.text = 'changed'
+
+        second = fragment_cache.get_or_generate('key', self.builder(html))
+        self.assertIsNot(first, second)
+        self.assertIsNone(second.getparent())
+        self.assertEqual(render_etree_to_string(second), '<div class="body"><span>cached</span></div>')
+
+    def test_string_fragments_are_not_copied(self):
+        fragment_cache = FragmentCache()
+        first = fragment_cache.get_or_generate('key', self.builder(HtmlGen(maker=string_maker)))
+        self.assertIs(fragment_cache.get('key'), first)
+
+    def test_least_recently_used_goes_first(self):
+        html = HtmlGen(maker=string_maker)
+        fragment_cache = FragmentCache(maxsize=2)
+        fragment_cache.set('a', html.b('a'))
+        fragment_cache.set('b', html.b('b'))
+        fragment_cache.get('a')
+        fragment_cache.set('c', html.b('c'))
+
+        self.assertIsNone(fragment_cache.get('b'))
+        self.assertIsNotNone(fragment_cache.get('a'))
+        self.assertIsNotNone(fragment_cache.get('c'))
@@ -0,0 +1,51 @@
+import logging
+
+from django.test import SimpleTestCase
+
+from paucore.web.jinja2_django import STREAM_FLUSH
+from paucore.web.template import _chunk_rendered_pieces
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def failing_pieces(pieces):
+    for piece in pieces:
+        yield piece
+    raise ValueError('broken presenter')
+
+
+class ChunkRenderedPiecesTest(SimpleTestCase):
+
+    def setUp(self):
+        self.handler = ListHandler()
+        self.logger = logging.getLogger('paucore.web.template')
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_chunks_at_flushes_and_size(self):
+        pieces = [u'<head>', STREAM_FLUSH, STREAM_FLUSH, u'a' * 4, u'b' * 4, u'caf\xe9']
+        self.assertEqual(list(_chunk_rendered_pieces(iter(pieces), 8)), ['<head>', 'aaaabbbb', 'caf\xc3\xa9'])
+
+    def test_error_after_the_first_chunk_is_logged(self):
+        chunks = _chunk_rendered_pieces(failing_pieces([u'<head>', STREAM_FLUSH, u'<body>']), 1024, 'stream.html')
+        self.assertEqual(next(chunks), '<head>')
+        self.assertRaises(ValueError, list, chunks)
+
+        self.assertEqual(len(self.handler.records), 1)
+        self.assertIn('stream.html', self.handler.records[0].getMessage())
+        self.assertIs(self.handler.records[0].exc_info[0], ValueError)
+
+    def test_error_before_the_first_chunk_is_left_to_the_view(self):
+        chunks = _chunk_rendered_pieces(failing_pieces([u'<head>']), 1024, 'stream.html')
+        self.assertRaises(ValueError, list, chunks)
+        self.assertEqual(self.handler.records, [])
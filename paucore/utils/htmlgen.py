@@ -6,9 +6,10 @@ import sys
 
 from functools import partial
 
+from django.conf import settings
 from lxml.builder import ElementMaker
 import lxml.html
-from lxml.etree import Entity
+from lxml.etree import Entity, iselement
 from lxml.html import html_parser, HtmlElement
 import jinja2
 
@@ -22,6 +23,61 @@ if sys.maxunicode == 65535:
 else:
     IMPROPER_HTML_ENCODING = re.compile(ur'[^\u0009\u000A\u000D\u0020-\uD7FF\uE000-\uFFFD\U00010000-\U0010FFFF]')
 
+_sub_improper = IMPROPER_HTML_ENCODING.sub
+# All IMPROPER_HTML_ENCODING can find in ascii text
+_ASCII_IMPROPER_CHARS = ''.join(chr(c) for c in xrange(0x20) if chr(c) not in '\t\n\r')
+
+
+class CleanStr(str):
+    "A str that's been through sanitize_text already, HtmlGen uses it as is."
+    __slots__ = ()
+
+
+class CleanUnicode(unicode):
+    "A unicode string that's been through sanitize_text already, HtmlGen uses it as is."
+    __slots__ = ()
+
+
+CLEAN_TEXT_TYPES = (CleanStr, CleanUnicode)
+
+
+def sanitize_text(value):
+    """
+    IMPROPER_HTML_ENCODING.sub('', value), without the regex for ascii text. Byte strings are ascii (lxml won't take
+    anything else) and so is most unicode we get, str.translate can drop the control characters a lot faster. Strings
+    marked by clean_text come back untouched.
+    """
+    value_type = type(value)
+    if value_type is CleanUnicode or value_type is CleanStr:
+        return value
+    elif value_type is str:
+        return value.translate(None, _ASCII_IMPROPER_CHARS)
+
+    try:
+        ascii_value = value.encode('ascii')
+    except UnicodeEncodeError:
+        return _sub_improper('', value)
+
+    sanitized = ascii_value.translate(None, _ASCII_IMPROPER_CHARS)
+    if len(sanitized) == len(ascii_value):
+        return value
+
+    return sanitized.decode('ascii')
+
+
+def clean_text(value):
+    "Sanitize a string once, where it comes in, and mark it so HtmlGen doesn't do it again for every element it's in."
+    if not isinstance(value, basestring):
+        return value
+
+    value = sanitize_text(value)
+    if isinstance(value, CLEAN_TEXT_TYPES):
+        return value
+    elif isinstance(value, str):
+        return CleanStr(value)
+
+    return CleanUnicode(value)
+
 
 def _flatten_classes(classes):
     return set((' '.join(classes)).split(' '))
@@ -31,11 +87,39 @@ def _format_classes(class_set):
     return ' '.join(class_set)
 
 
+class HtmlFragment(object):
+    """
+    An element made by the string backend (StringElementMaker). It's just the finished markup, exactly what
+    lxml.html.tostring would have produced for the equivalent element, so putting it inside another element or
+    rendering it is only string joining. Like an lxml element its len() is the number of child elements.
+    """
+    __slots__ = ('markup', 'num_children')
+
+    def __init__(self, markup, num_children=0):
+        self.markup = markup
+        self.num_children = num_children
+
+    def __len__(self):
+        return self.num_children
+
+    def __deepcopy__(self, memo):
+        # immutable, no need to copy
+        return self
+
+    def __repr__(self):
+        return '<HtmlFragment %r>' % self.markup[:60]
+
+
+ELEMENT_TYPES = (HtmlElement, HtmlFragment)
+
+
 def render_etree(tree):
     # HtmlElement is a seq, but we want to treat seqs of HtmlElements differently than HtmlElements
     # XXX verify that this is a list of HtmlElements? we'll see after we audit redner_etree_to_string
     if tree is not None and is_seq_not_string(tree) and not isinstance(tree, HtmlElement):
         return jinja2.Markup(''.join(map(render_etree_to_string, tree)))
+    elif isinstance(tree, HtmlFragment):
+        return jinja2.Markup(tree.markup)
     elif tree is not None and not isinstance(tree, jinja2.runtime.Undefined):
         # etrees evaluate to false, so we check is not None, but jinja2.runtime.Undefined could get passed in here
         return jinja2.Markup(lxml.html.tostring(tree))
@@ -66,13 +150,15 @@ def render_etree_to_string(tree):
         return ''
     elif isinstance(tree, basestring):
         return tree
+    elif isinstance(tree, HtmlFragment):
+        return tree.markup
     else:
         return lxml.html.tostring(tree)
 
 
 def render_presenters(presenters, wrapper=None, sep=None):
     # just checking if presenters doesn't work for HtmlElements, so check that separately--they don't need to go through present
-    if isinstance(presenters, HtmlElement):
+    if isinstance(presenters, ELEMENT_TYPES):
         return render_etree(presenters)
     elif presenters:
         trees = HtmlGen().present(presenters, wrapper, sep)
@@ -121,16 +207,211 @@ HtmlElement.__bases__ += (MXMLGenericElementMixin,)
 
 
 maker = ElementMaker(makeelement=html_parser.makeelement)
+
+
+# The string backend. These follow libxml2's html serializer, which is what lxml.html.tostring uses, so both backends
+# give byte for byte the same html.
+_URI_ATTRIBUTES = frozenset(('href', 'src', 'action'))
+_BOOLEAN_ATTRIBUTES = frozenset(('checked', 'compact', 'declare', 'defer', 'disabled', 'ismap', 'multiple', 'nohref',
+                                 'noresize', 'noshade', 'nowrap', 'readonly', 'selected'))
+_RAW_TEXT_TAGS = frozenset(('script', 'style'))
+# &{...} is left alone in attributes, it's a server side include
+_ATTRIBUTE_ESCAPES = re.compile(r'&\{[^}]*\}|[&<>]')
+_ATTRIBUTE_ENTITIES = {'&': '&amp;', '<': '&lt;', '>': '&gt;'}
+_URI_LEADING_BLANKS = ' \t\n\r'
+
+
+def _uri_unsafe_pattern():
+    # Which characters get %-escaped in urls has changed between libxml2 versions, so ask the one we've got
+    unsafe = []
+    for c in map(chr, range(0x21, 0x7f)):
+        if c not in '&<>' and ('%%%02X' % ord(c)) in lxml.html.tostring(maker.a(href='x' + c)):
+            unsafe.append(re.escape(c))
+
+    return re.compile(r'[\x00-\x20\x7f-\xff%s]' % ''.join(unsafe))
+
+
+_URI_UNSAFE = _uri_unsafe_pattern()
+
+
+def _to_unicode(s):
+    # lxml only takes ascii byte strings too
+    return s if isinstance(s, unicode) else s.decode('ascii')
+
+
+def _escape_text(s):
+    return _to_unicode(s).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').encode('ascii', 'xmlcharrefreplace')
+
+
+def _escape_attribute(s):
+    s = _to_unicode(s)
+    if '&{' in s:
+        return _ATTRIBUTE_ESCAPES.sub(lambda m: _ATTRIBUTE_ENTITIES.get(m.group(0), m.group(0)), s)
+
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _quote_attribute(value):
+    if '"' in value:
+        if "'" in value:
+            return '"%s"' % value.replace('"', '&quot;')
+        return "'%s'" % value
+
+    return '"%s"' % value
+
+
+def _format_attribute(tag, name, value):
+    if not isinstance(value, basestring):
+        raise TypeError('bad attribute value type: %s(%r)' % (type(value).__name__, value))
+
+    lower_name = name.lower()
+    if lower_name in _BOOLEAN_ATTRIBUTES:
+        return ' ' + name
+
+    escaped = _escape_attribute(value)
+    if lower_name in _URI_ATTRIBUTES or (lower_name == 'name' and tag == 'a'):
+        escaped = _URI_UNSAFE.sub(lambda m: '%%%02X' % ord(m.group(0)), escaped.encode('utf-8').lstrip(_URI_LEADING_BLANKS))
+    else:
+        escaped = escaped.encode('ascii', 'xmlcharrefreplace')
+
+    markup = ' %s=%s' % (name, _quote_attribute(escaped))
+    if lower_name != 'name':
+        # how name comes out depends on the tag, everything else can be shared
+        if len(_attribute_cache) > 10000:
+            _attribute_cache.clear()
+        _attribute_cache[(name, value)] = markup
+
+    return markup
+
+
+# (name, value) -> formatted attribute, class names, rels and the like repeat all over a page
+_attribute_cache = {}
+
+
+def _set_attributes(attributes, positions, item):
+    "Apply a dict of attributes like lxml does, a name that's already set keeps its place"
+    if not attributes:
+        attributes.extend(item.iteritems())
+        return None
+
+    if positions is None:
+        positions = dict((name, i) for i, (name, _) in enumerate(attributes))
+
+    for name, value in item.iteritems():
+        if name in positions:
+            attributes[positions[name]] = (name, value)
+        else:
+            positions[name] = len(attributes)
+            attributes.append((name, value))
+
+    return positions
+
+
+class StringElementMaker(object):
+    """
+    A stand in for lxml's ElementMaker that builds HtmlFragments. Hand it to HtmlGen to get markup strings instead of
+    lxml trees, the html.div(class_=..., *children) api doesn't change.
+    """
+
+    def __init__(self):
+        self.tags = {}
+
+    def __getattr__(self, tag):
+        if tag.startswith('_'):
+            raise AttributeError(tag)
+
+        return partial(self.make, tag)
+
+    def tag_info(self, tag):
+        # What libxml2 does with an element depends on the tag (void elements, optional end tags), ask it once per tag.
+        # Gives back (is void, what follows the start tag when there's no content, end tag, is raw text)
+        info = self.tags.get(tag)
+        if info is None:
+            empty = lxml.html.tostring(maker(tag))
+            void = lxml.html.tostring(maker(tag, 'x')) == empty
+            info = self.tags[tag] = (void, empty[len(tag) + 2:], '</%s>' % tag, tag in _RAW_TEXT_TAGS)
+
+        return info
+
+    def text(self, raw_text, s):
+        if raw_text:
+            return _to_unicode(s).encode('ascii', 'xmlcharrefreplace')
+
+        return _escape_text(s)
+
+    def make(self, tag, *children, **attrib):
+        void, empty, close, raw_text = self.tags.get(tag) or self.tag_info(tag)
+        # the same order lxml's ElementMaker sets things: keyword attributes then children, dicts are attributes
+        attributes = attrib.items()
+        positions = None
+        content = [None]
+        num_children = 0
+
+        for item in children:
+            item_type = type(item)
+            if item_type is HtmlFragment:
+                num_children += 1
+                content.append(item.markup)
+            elif item_type is unicode or item_type is str or item_type is CleanUnicode or item_type is CleanStr:
+                content.append(_escape_text(item) if not raw_text else self.text(raw_text, item))
+            elif item_type is dict:
+                positions = _set_attributes(attributes, positions, item)
+            else:
+                if callable(item):
+                    item = item()
+
+                if isinstance(item, basestring):
+                    content.append(self.text(raw_text, item))
+                elif isinstance(item, dict):
+                    positions = _set_attributes(attributes, positions, item)
+                elif isinstance(item, HtmlFragment):
+                    num_children += 1
+                    content.append(item.markup)
+                elif iselement(item):
+                    # something that was built with lxml, entities for example
+                    num_children += 1
+                    content.append(lxml.html.tostring(item))
+                else:
+                    raise TypeError('bad argument type: %s(%r)' % (type(item).__name__, item))
+
+        if attributes:
+            cache_get = _attribute_cache.get
+            start = '<%s%s>' % (tag, ''.join([cache_get((name, value)) or _format_attribute(tag, name, value)
+                                               for name, value in attributes]))
+        else:
+            start = '<%s>' % tag
+
+        if void:
+            markup = start
+        elif len(content) == 1:
+            markup = start + empty
+        else:
+            content[0] = start
+            content.append(close)
+            markup = ''.join(content)
+
+        return HtmlFragment(markup, num_children)
+
+
+string_maker = StringElementMaker()
 _cls_cache = {}
 
 
+def get_default_maker():
+    # HTMLGEN_BACKEND picks what HtmlGen builds: 'lxml' for lxml trees, 'string' to opt in to markup strings
+    if getattr(settings, 'HTMLGEN_BACKEND', 'lxml') == 'string':
+        return string_maker
+
+    return maker
+
+
 # TODO:
 # Mark's thoughts about some of this:
 # - making links/buttons is going to be such a common case we'll probably want a helper method in here for that
 class HtmlGen(object):
-    def __init__(self, maker=maker):
+    def __init__(self, maker=None):
         super(HtmlGen, self).__init__()
-        self.maker = maker
+        self.maker = maker or get_default_maker()
 
     def __getattr__(self, attr):
         return partial(self.el, attr)
@@ -138,10 +419,11 @@ class HtmlGen(object):
     def el(self, tag, *args, **kwargs):
         canon_tag = tag.strip().lower()
 
-        if canon_tag not in _cls_cache:
-            _cls_cache[canon_tag] = getattr(self.maker, canon_tag)
+        cache_key = (id(self.maker), canon_tag)
+        if cache_key not in _cls_cache:
+            _cls_cache[cache_key] = getattr(self.maker, canon_tag)
 
-        tag_cls = _cls_cache[canon_tag]
+        tag_cls = _cls_cache[cache_key]
 
         (classes, kwargs) = extract_classes(kwargs)
         if classes:
@@ -190,13 +472,12 @@ class HtmlGen(object):
                 arg_items = []
                 for item in arg:
                     if isinstance(item, basestring):
-                        arg_items.append(IMPROPER_HTML_ENCODING.sub('', item))
+                        arg_items.append(sanitize_text(item))
                     else:
                         arg_items.append(item)
                 new_args.extend(arg_items)
             elif isinstance(arg, basestring):
-                proper_arg = IMPROPER_HTML_ENCODING.sub('', arg)
-                new_args.append(proper_arg)
+                new_args.append(sanitize_text(arg))
             else:
                 new_args.append(arg)
 
@@ -268,7 +549,7 @@ class HtmlGen(object):
             if wrapper:
                 rendered = wrapper(rendered)
 
-            if is_seq_not_string(rendered) and not isinstance(rendered, HtmlElement):
+            if is_seq_not_string(rendered) and not isinstance(rendered, ELEMENT_TYPES):
                 output.extend(rendered)
             else:
                 output.append(rendered)
@@ -288,3 +569,4 @@ class HtmlGen(object):
     # Turn a dictionary of style rules to the style attribute--no logic right now
     def _style(self, **styles):
         return {'style': "".join(["%s:%s;" % (k, v) for k, v in styles.iteritems()])}
+
@@ -1,4 +1,8 @@
-from paucore.utils.htmlgen import HtmlGen
+import collections
+import copy
+import threading
+
+from paucore.utils.htmlgen import HtmlFragment, HtmlGen
 
 
 html = HtmlGen()
@@ -30,6 +34,51 @@ class AbstractPresenter(object):
         raise Exception("This presenter can't render class:%s" % model.__class__.__name__)
 
 
+class FragmentCache(object):
+    """
+    A bounded, least recently used, per process cache of generated html. The string backend's HtmlFragments are finished
+    markup and get handed out as they are. lxml elements can only have one parent, so callers get their own copy of a
+    cached tree, copying a tree is a lot cheaper than building it again or parsing it back out of a string. set takes
+    the tree over, don't use it after handing it in.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.fragments = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def _copy(self, tree):
+        if isinstance(tree, HtmlFragment):
+            return tree
+
+        return copy.deepcopy(tree)
+
+    def get(self, key):
+        with self.lock:
+            tree = self.fragments.pop(key, None)
+            if tree is None:
+                return None
+            self.fragments[key] = tree
+
+        return self._copy(tree)
+
+    def set(self, key, tree):
+        with self.lock:
+            self.fragments.pop(key, None)
+            self.fragments[key] = tree
+            while len(self.fragments) > self.maxsize:
+                self.fragments.popitem(last=False)
+
+    def get_or_generate(self, key, generate):
+        tree = self.get(key)
+        if tree is None:
+            tree = generate()
+            self.set(key, tree)
+            tree = self._copy(tree)
+
+        return tree
+
+
 def html_list_to_english(L, with_period=False):
     'Convert a list into a string separated by commas and "and"'
     if len(L) == 0:
@@ -1,6 +1,7 @@
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
 from functools import wraps, update_wrapper
-from threading import Lock
+from threading import Event, Lock
+import time
 
 
 #
@@ -313,3 +314,104 @@ class EasyDict(dict):
             value = EasyDict(value) if isinstance(value, dict) else value
         super(EasyDict, self).__setattr__(name, value)
         self[name] = value
+
+
+class SingleFlightAbandoned(Exception):
+    """What waiters get when the call they were waiting on was killed (a timeout, greenlet exit) instead of failing."""
+    pass
+
+
+class SingleFlight(object):
+    """
+    Collapses concurrent calls with the same key into one. The first caller for a key runs the function, anybody else who
+    asks for that key while it's running waits and gets the same return value (or exception). Nothing is kept once the
+    call finishes, the next caller runs it again.
+    """
+
+    class Call(object):
+        __slots__ = ('done', 'result', 'error')
+
+        def __init__(self):
+            self.done = Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = Lock()
+        self.calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Returns (result, shared), shared is True when the result came from somebody else's call."""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self.Call()
+
+        if not leader:
+            call.done.wait()
+            if isinstance(call.error, Exception):
+                raise call.error
+            elif call.error is not None:
+                # the leader's timeout or exit was aimed at the leader, not at us
+                raise SingleFlightAbandoned('%r was abandoned: %r' % (key, call.error))
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException, e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+        return call.result, False
+
+
+class LocalLRUCache(object):
+    """
+    A small thread safe in-process cache, entries go after ttl seconds or when maxsize newer ones push them out. For
+    sitting in front of the django cache, not instead of it: every process has its own copy.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.lock = Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return default
+
+            expires_at, value = entry
+            if expires_at < time.time():
+                return default
+
+            # put it back at the young end
+            self.entries[key] = entry
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time() + ttl, value)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Drop every entry predicate(key, value) is true for."""
+        with self.lock:
+            for key in [k for k, (_, v) in self.entries.iteritems() if predicate(k, v)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
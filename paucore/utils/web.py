@@ -1,9 +1,15 @@
+import hashlib
 import logging
+import os
+import time
 import urllib
+import uuid
 
 from django.conf import settings
 from django.core.urlresolvers import reverse
+from django.http import HttpResponseNotModified
 from django.utils.encoding import smart_str
+from django.utils.http import parse_etags
 
 from paucore.utils.python import lru_cache
 
@@ -95,3 +101,124 @@ def smart_reverse(request, view, args=None, kwargs=None, force_qualified=False,
         parts.append(url_fragment)
 
     return ''.join(parts)
+
+
+# Validators also roll over every CONDITIONAL_GET_ETAG_TTL seconds, the upstream ids they're built from don't move when
+# a post picks up a star or a profile gets edited, so this caps how long a browser can keep revalidating an old copy.
+CONDITIONAL_GET_ETAG_TTL = getattr(settings, 'CONDITIONAL_GET_ETAG_TTL', 60)
+
+
+def weak_etag(request, parts):
+    """
+    A weak ETag for a response to this request built from parts, something cheap that changes whenever the response
+    would (the ids at either end of a stream, say). The viewer, the full path, the pjax header and the build all go in
+    too so two different pages can never validate each other, and so does the csrf token if it went into the response.
+    """
+    user = getattr(request, 'user', None)
+    viewer = user.pk if user and user.is_authenticated() else 0
+    csrf_token = request.META.get('CSRF_COOKIE') if request.META.get('CSRF_COOKIE_USED') else None
+    key = repr((settings.BUILD_INFO, viewer, csrf_token, request.get_full_path(),
+                request.META.get('HTTP_X_PJAX'), int(time.time() // CONDITIONAL_GET_ETAG_TTL), parts))
+
+    return 'W/"%s"' % hashlib.md5(smart_str(key)).hexdigest()
+
+
+def etag_matches(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == '*':
+        return True
+
+    # weak comparison, parse_etags drops the W/ from both sides
+    return parse_etags(etag)[0] in parse_etags(if_none_match)
+
+
+def not_modified_response(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+class MultipartFormStream(object):
+    """
+    A multipart/form-data body that's read out a piece at a time, so the files in it go out a chunk at a time instead of
+    being copied into one big string first. Hand it to requests as data= along with content_type as the Content-Type.
+    fields is a dict or QueryDict, files a dict of name -> (filename, file object, content type) like requests takes.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, fields, files):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary=%s' % self.boundary
+        self.parts = []
+
+        field_lists = fields.lists() if hasattr(fields, 'lists') else (fields or {}).iteritems()
+        for name, values in field_lists:
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            for value in values:
+                self.parts.append('%s\r\n%s\r\n' % (self.part_header(name), smart_str(value)))
+
+        for name, (filename, f, content_type) in files.iteritems():
+            self.parts.append('%s; filename="%s"\r\nContent-Type: %s\r\n\r\n' % (self.part_header(name, end=False),
+                                                                            smart_str(filename).replace('"', '\\"'),
+                                                                            smart_str(content_type or 'application/octet-stream')))
+            self.parts.append(f)
+            self.parts.append('\r\n')
+
+        self.parts.append('--%s--\r\n' % self.boundary)
+        self.length = sum(len(p) if isinstance(p, str) else file_size(p) for p in self.parts)
+        self.pieces = self.iter_pieces()
+        self.pending = ''
+
+    def part_header(self, name, end=True):
+        header = '--%s\r\nContent-Disposition: form-data; name="%s"' % (self.boundary, smart_str(name).replace('"', '\\"'))
+        return header + '\r\n' if end else header
+
+    def iter_pieces(self):
+        for part in self.parts:
+            if isinstance(part, str):
+                yield part
+                continue
+
+            part.seek(0)
+            while True:
+                chunk = part.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return self.pieces
+
+    def read(self, size=-1):
+        out = [self.pending]
+        have = len(self.pending)
+        while size < 0 or have < size:
+            piece = next(self.pieces, None)
+            if piece is None:
+                break
+            out.append(piece)
+            have += len(piece)
+
+        data = ''.join(out)
+        if size < 0:
+            self.pending = ''
+            return data
+
+        self.pending = data[size:]
+        return data[:size]
+
+
+def file_size(f):
+    size = getattr(f, 'size', None)
+    if size is None:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+
+    return size
@@ -29,7 +29,8 @@ def default_jscontext(request):
     if hasattr(request, 'unique_id'):
         context['__js_cookie_value'] = request.unique_id.cookie_value
 
-    context['__js_timestamp'] = datetime_to_secs(datetime.now()) * 1000
+    # kept on the request too, so a page cache can find it in the page and give every visitor the time they got it
+    context['__js_timestamp'] = request.js_timestamp = datetime_to_secs(datetime.now()) * 1000
     context['__js_build_info'] = settings.BUILD_INFO
 
     context['is_pjax'] = request.META.get('HTTP_X_PJAX')
@@ -8,7 +8,12 @@ Use:
 
 """
 import simplejson as json
+import hashlib
 import logging
+import os
+import re
+import sys
+import tempfile
 
 from django.template.loader import BaseLoader
 from django.template import TemplateDoesNotExist
@@ -17,6 +22,10 @@ from django.template.defaultfilters import escapejs, pluralize, urlencode
 from django.contrib.humanize.templatetags.humanize import intcomma
 from django.test import signals
 import jinja2
+from jinja2 import nodes
+from jinja2.ext import Extension
+from jinja2.lexer import Token
+from jinja2.utils import concat
 
 from paucore.utils.htmlgen import render_etree, render_presenters
 from paucore.utils.string import possessive, string_to_css_class, do_filesizeformat
@@ -49,34 +58,271 @@ def guess_autoescape(template_name):
     return ext in ('html', 'xml')
 
 
+class StreamFlush(jinja2.Markup):
+    "What {% flush %} outputs. It renders as nothing, when streaming it marks where to send what's been rendered so far."
+    pass
+
+
+STREAM_FLUSH = StreamFlush(u'')
+
+
+class StreamFlushExtension(Extension):
+    """
+    {% flush %}, put it before the slow part of a template so a streamed response sends everything up to there right
+    away. Autoescaped templates only, otherwise the marker gets turned into a plain string on the way out.
+    """
+    tags = set(['flush'])
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        return nodes.Output([self.call_method('_flush')]).set_lineno(lineno)
+
+    def _flush(self):
+        return STREAM_FLUSH
+
+
+_PREFORMATTED_TAG = re.compile(r'<(/?)(?:pre|textarea|script)\b', re.I)
+# conditional comments are for IE, leave those
+_HTML_COMMENT = re.compile(r'<!--(?!\[if).*?-->', re.DOTALL)
+_LINE_BREAK_WHITESPACE = re.compile(r'[ \t]*\n\s*')
+
+
+def _strip_template_text(text):
+    text = _HTML_COMMENT.sub('', text)
+    return _LINE_BREAK_WHITESPACE.sub('\n', text)
+
+
+class StripWhitespaceExtension(Extension):
+    """
+    Squeezes the indentation out of the html in our templates when they're compiled, so it's not rendered and sent
+    over and over and there's nothing left for html_slimmer to do at render time. Any run of whitespace with a line
+    break in it becomes just the line break and html comments go, which the browser renders exactly the same way. Text
+    in <pre>, <textarea> and <script> is left alone.
+    """
+
+    def filter_stream(self, stream):
+        if not guess_autoescape(stream.name):
+            for token in stream:
+                yield token
+            return
+
+        preformatted = False
+        for token in stream:
+            if token.type != 'data':
+                yield token
+                continue
+
+            pieces = []
+            pos = 0
+            for match in _PREFORMATTED_TAG.finditer(token.value):
+                piece = token.value[pos:match.start()]
+                pieces.append(piece if preformatted else _strip_template_text(piece))
+                preformatted = not match.group(1)
+                pos = match.start()
+
+            piece = token.value[pos:]
+            pieces.append(piece if preformatted else _strip_template_text(piece))
+
+            yield Token(token.lineno, 'data', ''.join(pieces))
+
+
+class LayeredContext(object):
+    """
+    A read only view over a list of dicts where the first one with a key wins, what you'd get by flattening a Django
+    Context but without copying anything. Jinja2 reads template variables straight out of it.
+    """
+    __slots__ = ('maps',)
+
+    def __init__(self, maps):
+        self.maps = maps
+
+    def __getitem__(self, key):
+        for m in self.maps:
+            if key in m:
+                return m[key]
+
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        for m in self.maps:
+            if key in m:
+                return True
+
+        return False
+
+    def get(self, key, default=None):
+        for m in self.maps:
+            if key in m:
+                return m[key]
+
+        return default
+
+    def keys(self):
+        keys = set()
+        for m in self.maps:
+            keys.update(m)
+
+        return list(keys)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def iteritems(self):
+        for key in self.keys():
+            yield key, self[key]
+
+    def items(self):
+        return list(self.iteritems())
+
+
+def layer_context(context, extra_maps=()):
+    "A Django Context as a LayeredContext, the dicts pushed last come first."
+    return LayeredContext(list(extra_maps) + context.dicts[::-1])
+
+
+def collect_jscontext(context):
+    """
+    The __js_ keys of a Django Context without their prefix. A dict that keeps track of its own __js_ keys
+    (js_context_keys, like ViewContext) doesn't have to be looked through.
+    """
+    jscontext = {}
+
+    for d in context.dicts:
+        keys = getattr(d, 'js_context_keys', None)
+        if keys is None:
+            keys = [k for k in d if k.startswith(JSCONTEXT_KEY_PREFIX)]
+
+        for k in keys:
+            jscontext[k[JSCONTEXT_KEY_PREFIX_LEN:]] = d[k]
+
+    return jscontext
+
+
 class Template(jinja2.Template):
 
     def render(self, context):
-        # flatten the Django Context into a single dictionary.
-        # This code is duplicated in the get_macro_module function, kind of.
-        # If you find bugs here, you may want to update that function too.
-        context_dict = {}
+        template_vars = self.template_vars(context)
+        try:
+            return concat(self.root_render_func(self.new_context(template_vars, shared=True)))
+        except Exception:
+            exc_info = sys.exc_info()
 
-        for d in context.dicts:
-            context_dict.update(d)
+        return self.environment.handle_exception(exc_info, True)
 
-        jscontext = {}
+    def generate(self, context):
+        "Like render, but gives back the generator of rendered pieces for a streamed response."
+        return self._generate(self.template_vars(context))
 
-        for k, v in context_dict.iteritems():
-            if k.startswith(JSCONTEXT_KEY_PREFIX):
-                jscontext[k[JSCONTEXT_KEY_PREFIX_LEN:]] = v
+    def _generate(self, template_vars):
+        try:
+            for event in self.root_render_func(self.new_context(template_vars, shared=True)):
+                yield event
+        except Exception:
+            exc_info = sys.exc_info()
+        else:
+            return
+
+        yield self.environment.handle_exception(exc_info, True)
 
-        context_dict['page_context'] = json.dumps(jscontext, separators=(',', ':'))
+    def template_vars(self, context):
+        # Jinja2 reads straight from the layers of the Django Context (and our globals, a shared context doesn't get
+        # them added), nothing is copied.
+        # get_macro_module does the same thing, kind of. If you find bugs here, you may want to update that too.
+        page_vars = {
+            'page_context': json.dumps(collect_jscontext(context), separators=(',', ':')),
+        }
+        template_vars = layer_context(context, extra_maps=[page_vars])
+        template_vars.maps.append(self.globals)
 
-        if 'page_title' in context_dict and context_dict['page_title'] is None:
+        if 'page_title' in template_vars and template_vars['page_title'] is None:
             logger.warning("SET A PAGE TITLE FOR %s", self)
             if settings.DEBUG:
                 raise Exception("SET A PAGE TITLE!!!!")
 
         # This is useful for unit tests, so we can see the contexts used.
-        signals.template_rendered.send(sender=self, template=self, context=context_dict)
+        signals.template_rendered.send(sender=self, template=self, context=template_vars)
+
+        return template_vars
+
+
+class TemplateBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """
+    A FileSystemBytecodeCache that every worker on a box can share. Files are written to a temp file and renamed into
+    place so nobody reads half of one, and a cache file that can't be read or written just means compiling the
+    template from source like we would without a cache.
+    """
+
+    def load_bytecode(self, bucket):
+        try:
+            super(TemplateBytecodeCache, self).load_bytecode(bucket)
+        except Exception:
+            logger.warning('Unreadable jinja2 bytecode for %s, compiling from source', bucket.key, exc_info=True)
+            bucket.reset()
 
-        return super(Template, self).render(context_dict)
+    def dump_bytecode(self, bucket):
+        try:
+            fd, tmp_filename = tempfile.mkstemp(prefix='.tmp', dir=self.directory)
+        except (IOError, OSError):
+            logger.warning('Could not write jinja2 bytecode to %s', self.directory, exc_info=True)
+            return
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                bucket.write_bytecode(f)
+            os.rename(tmp_filename, self._get_cache_filename(bucket))
+        except (IOError, OSError):
+            logger.warning('Could not write jinja2 bytecode to %s', self.directory, exc_info=True)
+            try:
+                os.unlink(tmp_filename)
+            except OSError:
+                pass
+
+
+def _extension_source_hash(extension):
+    "The md5 of the source of the module a custom extension lives in, or its module name if that can't be read."
+    module = sys.modules.get(extension.__module__)
+    filename = getattr(module, '__file__', None) or ''
+    if filename.endswith(('.pyc', '.pyo')):
+        filename = filename[:-1]
+
+    try:
+        with open(filename, 'rb') as f:
+            return hashlib.md5(f.read()).hexdigest()
+    except (IOError, OSError):
+        return extension.__module__
+
+
+def get_bytecode_cache(extensions):
+    """
+    The bytecode cache for JINJA2_BYTECODE_CACHE_DIR, or None if that isn't set. The cache only checks whether the
+    template source changed, so the file names include everything else that changes what a template compiles to: the
+    extensions, the source of the ones that are ours, and the jinja2 version.
+    """
+    directory = getattr(settings, 'JINJA2_BYTECODE_CACHE_DIR', None)
+    if not directory:
+        return None
+
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                logger.warning('Could not create jinja2 bytecode cache dir %s', directory, exc_info=True)
+                return None
+
+    compile_options = [jinja2.__version__]
+    for extension in extensions:
+        if isinstance(extension, basestring):
+            compile_options.append(extension)
+        else:
+            compile_options.append('%s.%s' % (extension.__module__, extension.__name__))
+            compile_options.append(_extension_source_hash(extension))
+    fingerprint = hashlib.md5(repr(compile_options)).hexdigest()[:12]
+
+    return TemplateBytecodeCache(directory, pattern='__jinja2_%%s_%s.cache' % fingerprint)
 
 
 class Loader(BaseLoader):
@@ -98,15 +344,20 @@ class Loader(BaseLoader):
             'jinja2.ext.with_',
             'jinja2.ext.i18n',
             'jinja2.ext.autoescape',
+            StreamFlushExtension,
         )
 
+        if getattr(settings, 'JINJA2_STRIP_WHITESPACE', True):
+            extensions += (StripWhitespaceExtension,)
+
         if settings.DEBUG:
             cache_size = 50
         else:
             cache_size = -1
 
         env = jinja2.Environment(autoescape=guess_autoescape, trim_blocks=True, loader=loader, extensions=extensions,
-                                 cache_size=cache_size, auto_reload=settings.DEBUG, finalize=filter_none)
+                                 cache_size=cache_size, auto_reload=settings.DEBUG, finalize=filter_none,
+                                 bytecode_cache=get_bytecode_cache(extensions))
 
         env.template_class = Template
         env.filters['datetimeformat'] = datetimeformat
@@ -13,7 +13,11 @@ class NoCacheMiddleware(object):
 
     def process_response(self, request, response):
         if request.user.is_authenticated():
-            response['Cache-control'] = 'private, no-cache, no-store, must-revalidate'
+            if response.has_header('ETag'):
+                # the browser may keep this one as long as it asks us first, which is what gets it a 304
+                response['Cache-control'] = 'private, no-cache, must-revalidate'
+            else:
+                response['Cache-control'] = 'private, no-cache, no-store, must-revalidate'
             response['Expires'] = 'Thu, 9 Sep 1999 09:09:09 GMT'
             response['Pragma'] = 'no-cache'
         elif settings.DEBUG:
@@ -1,12 +1,20 @@
+import itertools
+import logging
+import time
 from functools import wraps
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.template.loader import render_to_string, get_template
 from django.template import RequestContext
 from slimmer import slimmer
 
 from paucore.utils.data import is_seq_not_string
-from paucore.stats.statsd_client import graphite_timer
+from paucore.stats.statsd_client import graphite_count, graphite_duration, graphite_timer
+from paucore.web.jinja2_django import StreamFlush, layer_context
+
+
+logger = logging.getLogger(__name__)
 
 
 def minify(html):
@@ -17,30 +25,38 @@ def minify(html):
     return slimmer.html_slimmer(html)
 
 
-def render_template_string(request, ctx, template, minify_html=None, extra_ctx=None):
-    with graphite_timer('jinja2.render_template_string'):
-        if minify_html is None:
-            minify_html = template.endswith('.html')
+def add_extra_ctx(request, ctx, extra_ctx):
+    if not extra_ctx:
+        return ctx
 
-        if extra_ctx:
-            if not is_seq_not_string(extra_ctx):
-                extra_ctx = [extra_ctx]
+    if not is_seq_not_string(extra_ctx):
+        extra_ctx = [extra_ctx]
 
-            new_ctx = {}
-            page_load_hooks = ctx.get('__js_page_load_hooks', [])
+    new_ctx = {}
+    page_load_hooks = ctx.get('__js_page_load_hooks', [])
 
-            for ctx_callable in extra_ctx:
-                ctx_item = ctx_callable(request)
-                if ctx_item:
-                    if '__js_page_load_hooks' in ctx_item:
-                        page_load_hooks.extend(ctx_item['__js_page_load_hooks'])
-                        del ctx_item['__js_page_load_hooks']
-                        new_ctx.update(ctx_item)
+    for ctx_callable in extra_ctx:
+        ctx_item = ctx_callable(request)
+        if ctx_item:
+            if '__js_page_load_hooks' in ctx_item:
+                page_load_hooks.extend(ctx_item['__js_page_load_hooks'])
+                del ctx_item['__js_page_load_hooks']
+                new_ctx.update(ctx_item)
 
-            new_ctx.update(ctx)
-            new_ctx['__js_page_load_hooks'] = page_load_hooks
+    new_ctx.update(ctx)
+    new_ctx['__js_page_load_hooks'] = page_load_hooks
 
-            ctx = new_ctx
+    return new_ctx
+
+
+def render_template_string(request, ctx, template, minify_html=None, extra_ctx=None):
+    with graphite_timer('jinja2.render_template_string'):
+        if minify_html is None:
+            # Templates have their whitespace taken out when they're compiled (see StripWhitespaceExtension), running
+            # html_slimmer over every page as well is opt in
+            minify_html = getattr(settings, 'MINIFY_HTML_AT_RUNTIME', False) and template.endswith('.html')
+
+        ctx = add_extra_ctx(request, ctx, extra_ctx)
 
         with graphite_timer('jinja2.render_to_string'):
             output = render_to_string(template, ctx, context_instance=RequestContext(request))
@@ -58,6 +74,68 @@ def render_template_string(request, ctx, template, minify_html=None, extra_ctx=N
         return output
 
 
+def render_template_chunks(request, ctx, template, extra_ctx=None, chunk_size=None):
+    """
+    Render a template a piece at a time, for a StreamingHttpResponse. Rendered output is sent along in utf-8 chunks of
+    about chunk_size bytes, and right away wherever the template has a {% flush %}, so the head and nav of a page can
+    go out while the stream items are still being rendered.
+
+    There's no html_slimmer here, it needs the whole page.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'TEMPLATE_STREAMING_CHUNK_SIZE', 16 * 1024)
+
+    ctx = add_extra_ctx(request, ctx, extra_ctx)
+
+    t = get_template(template)
+    if not hasattr(t, 'generate'):
+        raise Exception('render_template_chunks only works for Jinja2 templates')
+
+    # the context processors have to run now, not on the first next() after the middleware is all done
+    context_instance = RequestContext(request)
+    context_instance.update(ctx)
+
+    return _chunk_rendered_pieces(t.generate(context_instance), chunk_size, template)
+
+
+def _chunk_rendered_pieces(pieces, chunk_size, template=None):
+    start_time = time.time()
+    first_chunk = True
+    buf = []
+    buf_len = 0
+
+    try:
+        for piece in pieces:
+            if isinstance(piece, StreamFlush):
+                if not buf:
+                    continue
+            else:
+                buf.append(piece)
+                buf_len += len(piece)
+                if buf_len < chunk_size:
+                    continue
+
+            if first_chunk:
+                graphite_duration('jinja2.render_template_chunks.first_chunk', (time.time() - start_time) * 1000)
+                first_chunk = False
+
+            yield u''.join(buf).encode('utf-8')
+            buf = []
+            buf_len = 0
+    except Exception:
+        if not first_chunk:
+            # The status line and part of the page are already out, this can't become an error page. All the client
+            # sees is the page stop short, the server just drops the connection.
+            graphite_count('jinja2.render_template_chunks.error_after_first_chunk')
+            logger.exception('Error rendering %s after the first chunk was sent', template)
+        raise
+
+    if buf:
+        yield u''.join(buf).encode('utf-8')
+
+    graphite_duration('jinja2.render_template_chunks', (time.time() - start_time) * 1000)
+
+
 def get_macro_module(request, ctx, template):
     """Fetch a module that represents a template for the purpose of rendering individual macros as snippets."""
     ctx = ctx or {}
@@ -67,12 +145,10 @@ def get_macro_module(request, ctx, template):
         context_instance = RequestContext(request)
         context_instance.update(ctx)
 
-        flat_dict = {}
-
-        for d in context_instance.dicts:
-            flat_dict.update(d)
+        template_vars = layer_context(context_instance)
+        template_vars.maps.append(t.globals)
 
-        return t.make_module(t.new_context(flat_dict))
+        return t.make_module(template_vars, shared=True)
     else:
         raise Exception('get_macro_module only works for Jinja2 templates')
 
@@ -81,12 +157,32 @@ def render_template_response(request, ctx, template, no_cache=False, minify_html
     response = HttpResponse(render_template_string(request, ctx, template, minify_html, extra_ctx), status=status_code)
 
     if no_cache:
-        response['Pragma'] = 'no-cache'
-        response['Cache-Control'] = 'no-cache, must-revalidate'
+        set_no_cache_headers(response)
 
     return response
 
 
+def stream_template_response(request, ctx, template, no_cache=False, extra_ctx=None, status_code=200):
+    chunks = render_template_chunks(request, ctx, template, extra_ctx)
+    # Render the first chunk before handing the response back so a template that falls over straight away still turns
+    # into an error page instead of a 200 with nothing in it.
+    first_chunk = next(chunks, None)
+    if first_chunk is not None:
+        chunks = itertools.chain([first_chunk], chunks)
+
+    response = StreamingHttpResponse(chunks, status=status_code)
+
+    if no_cache:
+        set_no_cache_headers(response)
+
+    return response
+
+
+def set_no_cache_headers(response):
+    response['Pragma'] = 'no-cache'
+    response['Cache-Control'] = 'no-cache, must-revalidate'
+
+
 def template_response(template, no_cache=False, minify_html=None, extra_ctx=None):
 
     def render_template_decorator(view):
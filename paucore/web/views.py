@@ -9,13 +9,54 @@ from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.middleware.csrf import get_token
 
 from paucore.utils.string import camelcase_to_underscore
-from paucore.web.template import render_template_response
+from paucore.utils.web import etag_matches, not_modified_response, weak_etag
+from paucore.web.jinja2_django import JSCONTEXT_KEY_PREFIX
+from paucore.web.template import render_template_response, stream_template_response
 
 
 class ViewContext(dict):
+    """
+    The template context a view builds up. It keeps track of which of its keys are __js_ ones as they're set, so
+    rendering can put page_context together without looking through everything.
+    """
     response = None
     status_code = 200
 
+    def __init__(self, *args, **kwargs):
+        super(ViewContext, self).__init__(*args, **kwargs)
+        self.js_context_keys = set(k for k in self if k.startswith(JSCONTEXT_KEY_PREFIX))
+
+    def __setitem__(self, key, val):
+        if key.startswith(JSCONTEXT_KEY_PREFIX):
+            self.js_context_keys.add(key)
+        super(ViewContext, self).__setitem__(key, val)
+
+    def __delitem__(self, key):
+        super(ViewContext, self).__delitem__(key)
+        self.js_context_keys.discard(key)
+
+    def update(self, *args, **kwargs):
+        for key, val in dict(*args, **kwargs).iteritems():
+            self[key] = val
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        self.js_context_keys.discard(key)
+        return super(ViewContext, self).pop(key, *default)
+
+    def popitem(self):
+        key, val = super(ViewContext, self).popitem()
+        self.js_context_keys.discard(key)
+        return key, val
+
+    def clear(self):
+        super(ViewContext, self).clear()
+        self.js_context_keys.clear()
+
     def update_ctx(self, ctx_item):
         page_load_hooks = self.get('__js_page_load_hooks', [])
 
@@ -37,6 +78,9 @@ class MMLTemplateView(TemplateView):
     no_cache = False
     minify_html = None
     extra_ctx = None
+    # Send GET responses out as the template renders (see render_template_chunks), they don't get minified. Opt in,
+    # once the first chunk is out an error can only cut the page short.
+    stream_response = False
     # Setting the CSRF cookie by default has saved us from a lot of stupid bugs,
     # but sometimes we want to turn this off.
     set_csrf_token = True
@@ -59,10 +103,40 @@ class MMLTemplateView(TemplateView):
         # If this has been set, we want to take this path even if it's [] so a pure falsey check won't work
         if self.view_ctx.response is not None:
             return self.view_ctx.response
+
+        etag = self.get_etag(request, *args, **kwargs)
+        if etag and etag_matches(request, etag):
+            return not_modified_response(etag)
+
+        if self.stream_response:
+            response = stream_template_response(request, self.view_ctx, self.template_name, no_cache=self.no_cache,
+                                                extra_ctx=self.extra_ctx, status_code=self.view_ctx.status_code)
         else:
-            return render_template_response(request, self.view_ctx, self.template_name, no_cache=self.no_cache,
-                                            minify_html=self.minify_html, extra_ctx=self.extra_ctx,
-                                            status_code=self.view_ctx.status_code)
+            response = render_template_response(request, self.view_ctx, self.template_name, no_cache=self.no_cache,
+                                                minify_html=self.minify_html, extra_ctx=self.extra_ctx,
+                                                status_code=self.view_ctx.status_code)
+
+        if etag:
+            response['ETag'] = etag
+
+        return response
+
+    def get_etag_parts(self, request, *args, **kwargs):
+        """
+        Called after populate_context. Return something cheap that changes whenever the rendered page would, and the page
+        gets a weak ETag and is answered with a 304 before rendering when the browser already has it. None means no ETag.
+        """
+        return None
+
+    def get_etag(self, request, *args, **kwargs):
+        if self.no_cache or self.view_ctx.status_code != 200:
+            return None
+
+        parts = self.get_etag_parts(request, *args, **kwargs)
+        if parts is None:
+            return None
+
+        return weak_etag(request, parts)
 
     def dispatch(self, request, *args, **kwargs):
         self.view_ctx = ViewContext()